@@ -5,14 +5,20 @@ Face Mask Detection System - Main Application
 
 import os
 import logging
+import queue
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request
+from functools import lru_cache
+from typing import NamedTuple
+from flask import Flask, Response, render_template, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from dotenv import load_dotenv
+import orjson
+from sqlalchemy import and_, or_, select
 
 # Import our modules
-from src.database import init_db, get_db_session
+from src.database import init_db, get_db_session, remove_db_session
 from src.models import Detection, Camera, Alert
 from src.camera_manager import CameraManager
 from src.detection_engine import DetectionEngine
@@ -36,36 +42,70 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config.from_object(Config)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Before', 'X-Next-Before-Id'])
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# Global instances
-camera_manager = None
-detection_engine = None
-telegram_bot = None
-mqtt_client = None
-analytics_engine = None
+# Return each request's scoped session to the pool
+app.teardown_appcontext(remove_db_session)
+
+# Socket.IO rooms for subscription-based broadcasts
+DETECTIONS_ROOM = 'detections'
+CAMERA_STATUS_ROOM = 'camera_status'
+
+# Periods accepted by the CSV export
+EXPORT_PERIODS = ('today', 'week', 'month')
+
+# Outbound broadcasts drained by a single writer task
+broadcast_queue = queue.Queue(maxsize=Config.SOCKETIO_QUEUE_SIZE)
+
+class Services(NamedTuple):
+    """Initialized system services"""
+    camera_manager: CameraManager
+    detection_engine: DetectionEngine
+    telegram_bot: TelegramBot
+    mqtt_client: MQTTClient
+    analytics_engine: AnalyticsEngine
+
+@lru_cache(maxsize=1)
+def services() -> Services:
+    """Create system services once and return the shared instances"""
+    # Initialize database
+    init_db()
+    
+    # Initialize services
+    svc = Services(
+        camera_manager=CameraManager(),
+        detection_engine=DetectionEngine(),
+        telegram_bot=TelegramBot(),
+        mqtt_client=MQTTClient(),
+        analytics_engine=AnalyticsEngine()
+    )
+    
+    # Start camera manager
+    svc.camera_manager.start()
+    
+    return svc
 
 def initialize_services():
     """Initialize all system services"""
-    global camera_manager, detection_engine, telegram_bot, mqtt_client, analytics_engine
-    
     try:
-        # Initialize database
-        init_db()
-        
-        # Initialize services
-        camera_manager = CameraManager()
-        detection_engine = DetectionEngine()
-        telegram_bot = TelegramBot()
-        mqtt_client = MQTTClient()
-        analytics_engine = AnalyticsEngine()
+        services()
         
-        # Start camera manager
-        camera_manager.start()
+        # Start Socket.IO broadcast writer
+        socketio.start_background_task(broadcast_writer)
         
         logger.info("All services initialized successfully")
         
@@ -82,7 +122,8 @@ def index():
 def get_status():
     """Get system status"""
     try:
-        cameras = camera_manager.get_cameras() if camera_manager else []
+        svc = services()
+        cameras = svc.camera_manager.get_cameras()
         active_cameras = len([c for c in cameras if c.is_active])
         
         return jsonify({
@@ -93,14 +134,14 @@ def get_status():
                 'active': active_cameras
             },
             'detections': {
-                'total_today': analytics_engine.get_today_detections() if analytics_engine else 0,
-                'violations_today': analytics_engine.get_today_violations() if analytics_engine else 0
+                'total_today': svc.analytics_engine.get_today_detections(),
+                'violations_today': svc.analytics_engine.get_today_violations()
             },
             'services': {
-                'camera_manager': camera_manager.is_running if camera_manager else False,
-                'detection_engine': detection_engine.is_running if detection_engine else False,
-                'telegram_bot': telegram_bot.is_connected if telegram_bot else False,
-                'mqtt_client': mqtt_client.is_connected if mqtt_client else False
+                'camera_manager': svc.camera_manager.is_running,
+                'detection_engine': svc.detection_engine.is_running,
+                'telegram_bot': svc.telegram_bot.is_connected,
+                'mqtt_client': svc.mqtt_client.is_connected
             }
         })
     except Exception as e:
@@ -111,7 +152,7 @@ def get_status():
 def get_cameras():
     """Get all cameras"""
     try:
-        cameras = camera_manager.get_cameras() if camera_manager else []
+        cameras = services().camera_manager.get_cameras()
         return jsonify([camera.to_dict() for camera in cameras])
     except Exception as e:
         logger.error(f"Error getting cameras: {e}")
@@ -123,6 +164,7 @@ def control_camera(camera_id):
     try:
         data = request.get_json()
         action = data.get('action')
+        camera_manager = services().camera_manager
         
         if action == 'start':
             camera_manager.start_camera(camera_id)
@@ -133,11 +175,53 @@ def control_camera(camera_id):
         else:
             return jsonify({'error': 'Invalid action'}), 400
             
+        services().analytics_engine.invalidate_cameras()
+        
         return jsonify({'message': f'Camera {camera_id} {action}ed successfully'})
     except Exception as e:
         logger.error(f"Error controlling camera {camera_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
+class InvalidCursor(ValueError):
+    """Malformed keyset pagination cursor"""
+
+def apply_keyset_cursor(query, model):
+    """Filter query to rows older than the ?before=<iso>&before_id=<id> cursor"""
+    before = request.args.get('before')
+    if not before:
+        return query, False
+    
+    before_id = request.args.get('before_id')
+    try:
+        before = datetime.fromisoformat(before)
+        before_id = int(before_id) if before_id else None
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+    
+    if before_id is None:
+        return query.filter(model.timestamp < before), True
+    
+    return query.filter(
+        or_(
+            model.timestamp < before,
+            and_(model.timestamp == before, model.id < before_id)
+        )
+    ), True
+
+def json_rows_response(rows):
+    """Serialize Core result rows straight to a JSON response"""
+    return Response(
+        orjson.dumps([dict(row._mapping) for row in rows]),
+        mimetype='application/json'
+    )
+
+def set_next_cursor(response, rows, per_page):
+    """Expose the cursor for the next page in response headers"""
+    if rows and len(rows) == per_page and rows[-1].timestamp:
+        response.headers['X-Next-Before'] = rows[-1].timestamp.isoformat()
+        response.headers['X-Next-Before-Id'] = str(rows[-1].id)
+    return response
+
 @app.route('/api/detections')
 def get_detections():
     """Get detection history"""
@@ -147,16 +231,23 @@ def get_detections():
         camera_id = request.args.get('camera_id')
         
         session = get_db_session()
-        query = session.query(Detection)
+        query = select(Detection.__table__)
         
         if camera_id:
             query = query.filter(Detection.camera_id == camera_id)
-            
-        detections = query.order_by(Detection.timestamp.desc()).offset(
-            (page - 1) * per_page
-        ).limit(per_page).all()
         
-        return jsonify([detection.to_dict() for detection in detections])
+        # Prefer keyset pagination; OFFSET is kept for page-based clients
+        query, has_cursor = apply_keyset_cursor(query, Detection)
+        query = query.order_by(Detection.timestamp.desc(), Detection.id.desc())
+        if not has_cursor:
+            query = query.offset((page - 1) * per_page)
+        
+        detections = session.execute(query.limit(per_page)).all()
+        
+        response = json_rows_response(detections)
+        return set_next_cursor(response, detections, per_page)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting detections: {e}")
         return jsonify({'error': str(e)}), 500
@@ -167,15 +258,29 @@ def get_analytics():
     try:
         period = request.args.get('period', 'today')
         
-        if not analytics_engine:
-            return jsonify({'error': 'Analytics engine not available'}), 500
-            
-        data = analytics_engine.get_analytics(period)
+        data = services().analytics_engine.get_analytics(period)
         return jsonify(data)
     except Exception as e:
         logger.error(f"Error getting analytics: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analytics/export')
+def export_analytics():
+    """Stream detections for a period as CSV"""
+    try:
+        period = request.args.get('period', 'today')
+        if period not in EXPORT_PERIODS:
+            return jsonify({'error': f"Invalid period, expected one of: {', '.join(EXPORT_PERIODS)}"}), 400
+        
+        return Response(
+            services().analytics_engine.stream_csv(period),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=detections_{period}.csv'}
+        )
+    except Exception as e:
+        logger.error(f"Error exporting analytics: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/alerts')
 def get_alerts():
     """Get alert history"""
@@ -184,11 +289,17 @@ def get_alerts():
         per_page = request.args.get('per_page', 20, type=int)
         
         session = get_db_session()
-        alerts = session.query(Alert).order_by(
-            Alert.timestamp.desc()
-        ).offset((page - 1) * per_page).limit(per_page).all()
+        query, has_cursor = apply_keyset_cursor(select(Alert.__table__), Alert)
+        query = query.order_by(Alert.timestamp.desc(), Alert.id.desc())
+        if not has_cursor:
+            query = query.offset((page - 1) * per_page)
+        
+        alerts = session.execute(query.limit(per_page)).all()
         
-        return jsonify([alert.to_dict() for alert in alerts])
+        response = json_rows_response(alerts)
+        return set_next_cursor(response, alerts, per_page)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting alerts: {e}")
         return jsonify({'error': str(e)}), 500
@@ -208,24 +319,64 @@ def handle_disconnect():
 @socketio.on('subscribe_detections')
 def handle_subscribe_detections():
     """Subscribe to detection updates"""
+    join_room(DETECTIONS_ROOM)
     logger.info(f"Client {request.sid} subscribed to detections")
 
 @socketio.on('subscribe_camera_status')
 def handle_subscribe_camera_status():
     """Subscribe to camera status updates"""
+    join_room(CAMERA_STATUS_ROOM)
     logger.info(f"Client {request.sid} subscribed to camera status")
 
+def broadcast_writer():
+    """Emit queued broadcasts, merging bursts of detections into one message"""
+    while True:
+        batch = [broadcast_queue.get()]
+        while len(batch) < Config.SOCKETIO_BATCH_SIZE:
+            try:
+                batch.append(broadcast_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        # Room emits encode each packet once and reuse it for every member
+        detections = [data for event, data in batch if event == 'detection_update']
+        if len(detections) > 1:
+            emit_broadcast('detection_batch', detections, DETECTIONS_ROOM)
+        
+        for event, data in batch:
+            if event == 'detection_update':
+                if len(detections) == 1:
+                    emit_broadcast(event, data, DETECTIONS_ROOM)
+            elif event == 'camera_status':
+                emit_broadcast(event, data, CAMERA_STATUS_ROOM)
+            else:
+                emit_broadcast(event, data)
+
+def emit_broadcast(event, data, room=None):
+    """Emit one broadcast, logging failures so the writer keeps running"""
+    try:
+        socketio.emit(event, data, to=room)
+    except Exception as e:
+        logger.error(f"Error broadcasting {event}: {e}")
+
+def enqueue_broadcast(event, data):
+    """Queue message for the broadcast writer, dropping it when backlogged"""
+    try:
+        broadcast_queue.put_nowait((event, data))
+    except queue.Full:
+        logger.debug(f"Broadcast queue full, dropping {event}")
+
 def broadcast_detection(detection_data):
-    """Broadcast detection to all connected clients"""
-    socketio.emit('detection_update', detection_data)
+    """Broadcast detection to subscribed clients"""
+    enqueue_broadcast('detection_update', detection_data)
 
 def broadcast_camera_status(camera_data):
-    """Broadcast camera status to all connected clients"""
-    socketio.emit('camera_status', camera_data)
+    """Broadcast camera status to subscribed clients"""
+    enqueue_broadcast('camera_status', camera_data)
 
 def broadcast_alert(alert_data):
     """Broadcast alert to all connected clients"""
-    socketio.emit('alert', alert_data)
+    enqueue_broadcast('alert', alert_data)
 
 if __name__ == '__main__':
     # Create logs directory
@@ -66,6 +66,8 @@ function Dashboard() {
 
     newSocket.on('connect', () => {
       console.log('Connected to server');
+      newSocket.emit('subscribe_detections');
+      newSocket.emit('subscribe_camera_status');
       toast.success('Connected to Face Mask Detection System');
     });
 
@@ -78,6 +80,10 @@ function Dashboard() {
       setRecentDetections(prev => [data, ...prev.slice(0, 9)]);
     });
 
+    newSocket.on('detection_batch', (batch) => {
+      setRecentDetections(prev => [...batch.slice().reverse(), ...prev].slice(0, 10));
+    });
+
     newSocket.on('alert', (data) => {
       setRecentAlerts(prev => [data, ...prev.slice(0, 4)]);
       toast.error(`New Alert: ${data.message}`, { duration: 5000 });
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+INT8 TFLite conversion script for the face mask detection model
+"""
+
+import os
+import sys
+import glob
+import logging
+import cv2
+import numpy as np
+import tensorflow as tf
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def representative_dataset(image_dir: str, limit: int = 200):
+    """Yield preprocessed face crops for INT8 calibration"""
+    paths = sorted(glob.glob(os.path.join(image_dir, '*.jpg')) + glob.glob(os.path.join(image_dir, '*.png')))
+    if not paths:
+        raise ValueError(f"No calibration images found in {image_dir}")
+    
+    for path in paths[:limit]:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        image = cv2.resize(image, (224, 224)).astype(np.float32) / 255.0
+        yield [image[np.newaxis, ...]]
+
+def main():
+    """Main conversion function"""
+    if len(sys.argv) < 2:
+        logger.error("Usage: python scripts/convert_tflite.py <calibration_image_dir>")
+        sys.exit(1)
+    
+    try:
+        logger.info(f"Loading Keras model from {Config.MODEL_PATH}")
+        model = tf.keras.models.load_model(Config.MODEL_PATH)
+        
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: representative_dataset(sys.argv[1])
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+        
+        with open(Config.TFLITE_MODEL_PATH, 'wb') as f:
+            f.write(converter.convert())
+        
+        logger.info(f"INT8 model written to {Config.TFLITE_MODEL_PATH}")
+    
+    except Exception as e:
+        logger.error(f"Model conversion failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
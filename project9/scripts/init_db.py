@@ -7,6 +7,7 @@ import os
 import sys
 import logging
 from dotenv import load_dotenv
+from sqlalchemy import insert
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -69,11 +70,8 @@ def create_sample_cameras():
             }
         ]
         
-        # Create camera records
-        for camera_data in sample_cameras:
-            camera = CameraModel(**camera_data)
-            session.add(camera)
-        
+        # Create camera records in a single bulk INSERT
+        session.execute(insert(CameraModel), sample_cameras)
         session.commit()
         logger.info(f"Created {len(sample_cameras)} sample cameras")
         session.close()
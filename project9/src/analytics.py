@@ -3,116 +3,165 @@ Analytics Engine - Data analysis and reporting
 """
 
 import logging
-import json
+import csv
+import io
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
-from sqlalchemy import func, and_, desc
+from typing import Dict, List, Any, Tuple, Iterator
+from sqlalchemy import func, and_, desc, select, bindparam, case
 import pandas as pd
+import orjson
 
 from .config import Config
-from .database import get_db_session, Detection as DetectionModel, Camera as CameraModel, Alert as AlertModel
+from .database import engine, get_db_session, Detection as DetectionModel, Camera as CameraModel, Alert as AlertModel
 
 logger = logging.getLogger(__name__)
 
+# Status counters run on every /api/status poll; build the statements once
+# and execute them on a plain connection to skip ORM session overhead
+_TODAY_COUNTS_QUERY = select(
+    func.count(DetectionModel.id),
+    func.sum(case((DetectionModel.no_mask_count > 0, 1), else_=0))
+).where(
+    and_(
+        DetectionModel.timestamp >= bindparam('start'),
+        DetectionModel.timestamp < bindparam('end')
+    )
+)
+
 class AnalyticsEngine:
     """Analytics engine for data analysis and reporting"""
     
     def __init__(self):
-        self.cache = {}
+        self.cache = OrderedDict()
         self.cache_ttl = 300  # 5 minutes cache
+        self.cache_max_size = 64
+        self._cache_lock = threading.Lock()
+        self._inflight = {}  # cache_key -> Event set when the computing thread finishes
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._counter_cache = {}
+        self._counter_lock = threading.Lock()
+        self.counter_cache_ttl = 2  # Collapse rapid status polls into one query
+        self._camera_names = None
+        self._camera_names_ts = 0.0
+        self.camera_names_ttl = 60
+    
+    def _cached(self, key: str, ttl: float, fn):
+        """Return cached result of fn if younger than ttl seconds"""
+        cached = self._counter_cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] < ttl:
+            return cached[0]
+        
+        # Single flight: concurrent misses wait here and reuse the first thread's result
+        with self._counter_lock:
+            now = time.monotonic()
+            cached = self._counter_cache.get(key)
+            if cached is not None and now - cached[1] < ttl:
+                return cached[0]
+            
+            value = fn()
+            self._counter_cache[key] = (value, now)
+            return value
     
     def get_today_detections(self) -> int:
         """Get total detections for today"""
-        try:
-            session = get_db_session()
-            today = datetime.now().date()
-            
-            count = session.query(func.count(DetectionModel.id)).filter(
-                func.date(DetectionModel.timestamp) == today
-            ).scalar()
-            
-            session.close()
-            return count or 0
-            
-        except Exception as e:
-            logger.error(f"Error getting today's detections: {e}")
-            return 0
+        return self._cached('today_counts', self.counter_cache_ttl, self._query_today_counts)[0]
     
     def get_today_violations(self) -> int:
         """Get total violations for today"""
+        return self._cached('today_counts', self.counter_cache_ttl, self._query_today_counts)[1]
+    
+    def _query_today_counts(self) -> Tuple[int, int]:
+        """Query total detections and violations for today in one pass"""
         try:
-            session = get_db_session()
-            today = datetime.now().date()
+            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            end = start + timedelta(days=1)
             
-            count = session.query(func.count(DetectionModel.id)).filter(
-                and_(
-                    func.date(DetectionModel.timestamp) == today,
-                    DetectionModel.no_mask_count > 0
-                )
-            ).scalar()
+            with engine.connect() as conn:
+                detections, violations = conn.execute(
+                    _TODAY_COUNTS_QUERY, {'start': start, 'end': end}
+                ).one()
             
-            session.close()
-            return count or 0
+            return detections or 0, violations or 0
             
         except Exception as e:
-            logger.error(f"Error getting today's violations: {e}")
-            return 0
+            logger.error(f"Error getting today's detection counts: {e}")
+            return 0, 0
     
     def get_analytics(self, period: str = "today") -> Dict:
         """Get comprehensive analytics for specified period"""
         cache_key = f"analytics_{period}"
         
-        # Check cache
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if (datetime.now() - timestamp).seconds < self.cache_ttl:
-                return cached_data
+        while True:
+            with self._cache_lock:
+                # Check cache
+                if cache_key in self.cache:
+                    cached_data, timestamp = self.cache[cache_key]
+                    if time.monotonic() - timestamp < self.cache_ttl:
+                        self.cache.move_to_end(cache_key)
+                        self._cache_hits += 1
+                        return cached_data
+                
+                # Only one thread computes a given period; others wait for it
+                inflight = self._inflight.get(cache_key)
+                if inflight is None:
+                    inflight = self._inflight[cache_key] = threading.Event()
+                    self._cache_misses += 1
+                    break
+            
+            inflight.wait()
         
+        try:
+            analytics_data = self._compute_analytics(period)
+            
+            # Cache the result
+            if analytics_data:
+                with self._cache_lock:
+                    self.cache[cache_key] = (analytics_data, time.monotonic())
+                    self.cache.move_to_end(cache_key)
+                    while len(self.cache) > self.cache_max_size:
+                        self.cache.popitem(last=False)
+            
+            return analytics_data
+        finally:
+            with self._cache_lock:
+                self._inflight.pop(cache_key).set()
+    
+    def _get_date_range(self, period: str) -> Tuple[datetime, datetime]:
+        """Get start and end datetimes for specified period"""
+        end_date = datetime.now()
+        if period == "today":
+            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        elif period == "week":
+            start_date = end_date - timedelta(days=7)
+        elif period == "month":
+            start_date = end_date - timedelta(days=30)
+        else:
+            start_date = end_date - timedelta(days=1)  # Default to yesterday
+        return start_date, end_date
+    
+    def _compute_analytics(self, period: str) -> Dict:
+        """Query and aggregate analytics for specified period"""
         try:
             session = get_db_session()
             
             # Calculate date range
-            end_date = datetime.now()
-            if period == "today":
-                start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == "week":
-                start_date = end_date - timedelta(days=7)
-            elif period == "month":
-                start_date = end_date - timedelta(days=30)
-            else:
-                start_date = end_date - timedelta(days=1)  # Default to yesterday
+            start_date, end_date = self._get_date_range(period)
             
-            # Get detections in range
-            detections = session.query(DetectionModel).filter(
-                and_(
-                    DetectionModel.timestamp >= start_date,
-                    DetectionModel.timestamp <= end_date
-                )
-            ).all()
-            
-            # Calculate statistics
-            total_detections = len(detections)
-            total_faces = sum(d.face_count for d in detections)
-            total_masks = sum(d.mask_count for d in detections)
-            total_violations = sum(d.no_mask_count for d in detections)
+            # Aggregate detections in range with a single grouped scan
+            summary, camera_stats, hourly_stats = self._get_detection_statistics(session, start_date, end_date)
+            total_detections, total_faces, total_masks, total_violations = summary
             
             # Calculate rates
             mask_rate = (total_masks / total_faces * 100) if total_faces > 0 else 0
             violation_rate = (total_violations / total_faces * 100) if total_faces > 0 else 0
             
-            # Get camera statistics
-            camera_stats = self._get_camera_statistics(session, start_date, end_date)
-            
-            # Get hourly breakdown
-            hourly_stats = self._get_hourly_statistics(session, start_date, end_date)
-            
-            # Get alerts
-            alerts = session.query(AlertModel).filter(
-                and_(
-                    AlertModel.timestamp >= start_date,
-                    AlertModel.timestamp <= end_date
-                )
-            ).all()
+            # Get alert counts
+            alerts_by_type = self._count_alerts_by(session, AlertModel.alert_type, start_date, end_date)
+            alerts_by_severity = self._count_alerts_by(session, AlertModel.severity, start_date, end_date)
             
             analytics_data = {
                 'period': period,
@@ -129,136 +178,101 @@ class AnalyticsEngine:
                 'camera_statistics': camera_stats,
                 'hourly_breakdown': hourly_stats,
                 'alerts': {
-                    'total': len(alerts),
-                    'by_type': self._group_alerts_by_type(alerts),
-                    'by_severity': self._group_alerts_by_severity(alerts)
+                    'total': sum(alerts_by_type.values()),
+                    'by_type': alerts_by_type,
+                    'by_severity': alerts_by_severity
                 }
             }
             
             session.close()
             
-            # Cache the result
-            self.cache[cache_key] = (analytics_data, datetime.now())
-            
             return analytics_data
             
         except Exception as e:
             logger.error(f"Error getting analytics: {e}")
             return {}
     
-    def _get_camera_statistics(self, session, start_date: datetime, end_date: datetime) -> List[Dict]:
-        """Get statistics by camera"""
-        try:
-            # Get detections grouped by camera
-            camera_detections = session.query(
-                DetectionModel.camera_id,
-                func.count(DetectionModel.id).label('detection_count'),
-                func.sum(DetectionModel.face_count).label('total_faces'),
-                func.sum(DetectionModel.mask_count).label('total_masks'),
-                func.sum(DetectionModel.no_mask_count).label('total_violations')
-            ).filter(
-                and_(
-                    DetectionModel.timestamp >= start_date,
-                    DetectionModel.timestamp <= end_date
-                )
-            ).group_by(DetectionModel.camera_id).all()
-            
-            # Get camera names
-            camera_names = {}
-            cameras = session.query(CameraModel).all()
-            for camera in cameras:
-                camera_names[camera.id] = camera.name
-            
-            camera_stats = []
-            for det in camera_detections:
-                total_faces = det.total_faces or 0
-                total_masks = det.total_masks or 0
-                total_violations = det.total_violations or 0
-                
-                mask_rate = (total_masks / total_faces * 100) if total_faces > 0 else 0
-                violation_rate = (total_violations / total_faces * 100) if total_faces > 0 else 0
-                
-                camera_stats.append({
-                    'camera_id': det.camera_id,
-                    'name': camera_names.get(det.camera_id, 'Unknown'),
-                    'detections': det.detection_count,
-                    'total_faces': total_faces,
-                    'total_masks': total_masks,
-                    'total_violations': total_violations,
-                    'mask_rate': round(mask_rate, 2),
-                    'violation_rate': round(violation_rate, 2)
-                })
-            
-            return camera_stats
-            
-        except Exception as e:
-            logger.error(f"Error getting camera statistics: {e}")
-            return []
+    def _get_detection_statistics(self, session, start_date: datetime, end_date: datetime) -> Tuple[List[int], List[Dict], List[Dict]]:
+        """Get summary totals, statistics by camera and hourly breakdown"""
+        # Get detections grouped by camera and hour
+        hour_expr = func.extract('hour', DetectionModel.timestamp)
+        grouped_detections = session.query(
+            DetectionModel.camera_id,
+            hour_expr.label('hour'),
+            func.count(DetectionModel.id).label('detection_count'),
+            func.sum(DetectionModel.face_count).label('total_faces'),
+            func.sum(DetectionModel.mask_count).label('total_masks'),
+            func.sum(DetectionModel.no_mask_count).label('total_violations')
+        ).filter(
+            and_(
+                DetectionModel.timestamp >= start_date,
+                DetectionModel.timestamp <= end_date
+            )
+        ).group_by(DetectionModel.camera_id, hour_expr).all()
+        
+        # Pivot (camera, hour) groups into overall, per-camera and per-hour totals
+        count_columns = ['detection_count', 'total_faces', 'total_masks', 'total_violations']
+        df = pd.DataFrame(grouped_detections, columns=['camera_id', 'hour'] + count_columns)
+        df = df.fillna(0).astype({column: int for column in count_columns + ['hour']})
+        
+        summary = [int(total) for total in df[count_columns].sum()]
+        camera_totals = df.groupby('camera_id')[count_columns].sum()
+        hourly_totals = df.groupby('hour')[count_columns].sum()
+        
+        camera_names = self._get_camera_names(session)
+        camera_stats = [
+            {
+                'camera_id': camera_id,
+                'name': camera_names.get(camera_id, 'Unknown'),
+                **self._format_statistics(totals)
+            }
+            for camera_id, totals in zip(camera_totals.index, camera_totals.values.tolist())
+        ]
+        
+        # groupby returns hours in sorted order
+        hourly_stats = [
+            {'hour': int(hour), **self._format_statistics(totals)}
+            for hour, totals in zip(hourly_totals.index, hourly_totals.values.tolist())
+        ]
+        
+        return summary, camera_stats, hourly_stats
     
-    def _get_hourly_statistics(self, session, start_date: datetime, end_date: datetime) -> List[Dict]:
-        """Get hourly breakdown of detections"""
-        try:
-            # Get detections grouped by hour
-            hourly_detections = session.query(
-                func.extract('hour', DetectionModel.timestamp).label('hour'),
-                func.count(DetectionModel.id).label('detection_count'),
-                func.sum(DetectionModel.face_count).label('total_faces'),
-                func.sum(DetectionModel.mask_count).label('total_masks'),
-                func.sum(DetectionModel.no_mask_count).label('total_violations')
-            ).filter(
-                and_(
-                    DetectionModel.timestamp >= start_date,
-                    DetectionModel.timestamp <= end_date
-                )
-            ).group_by(func.extract('hour', DetectionModel.timestamp)).all()
-            
-            hourly_stats = []
-            for det in hourly_detections:
-                total_faces = det.total_faces or 0
-                total_masks = det.total_masks or 0
-                total_violations = det.total_violations or 0
-                
-                mask_rate = (total_masks / total_faces * 100) if total_faces > 0 else 0
-                violation_rate = (total_violations / total_faces * 100) if total_faces > 0 else 0
-                
-                hourly_stats.append({
-                    'hour': int(det.hour),
-                    'detections': det.detection_count,
-                    'total_faces': total_faces,
-                    'total_masks': total_masks,
-                    'total_violations': total_violations,
-                    'mask_rate': round(mask_rate, 2),
-                    'violation_rate': round(violation_rate, 2)
-                })
-            
-            # Sort by hour
-            hourly_stats.sort(key=lambda x: x['hour'])
-            
-            return hourly_stats
-            
-        except Exception as e:
-            logger.error(f"Error getting hourly statistics: {e}")
-            return []
+    def _get_camera_names(self, session) -> Dict[str, str]:
+        """Get cached camera id to name mapping"""
+        now = time.monotonic()
+        if self._camera_names is None or now - self._camera_names_ts >= self.camera_names_ttl:
+            self._camera_names = dict(session.query(CameraModel.id, CameraModel.name).all())
+            self._camera_names_ts = now
+        return self._camera_names
     
-    def _group_alerts_by_type(self, alerts: List[AlertModel]) -> Dict:
-        """Group alerts by type"""
-        grouped = {}
-        for alert in alerts:
-            alert_type = alert.alert_type
-            if alert_type not in grouped:
-                grouped[alert_type] = 0
-            grouped[alert_type] += 1
-        return grouped
+    def invalidate_cameras(self):
+        """Drop cached camera names so the next call reloads them"""
+        self._camera_names = None
     
-    def _group_alerts_by_severity(self, alerts: List[AlertModel]) -> Dict:
-        """Group alerts by severity"""
-        grouped = {}
-        for alert in alerts:
-            severity = alert.severity
-            if severity not in grouped:
-                grouped[severity] = 0
-            grouped[severity] += 1
-        return grouped
+    def _format_statistics(self, totals: List[int]) -> Dict:
+        """Format detection totals with mask and violation rates"""
+        detection_count, total_faces, total_masks, total_violations = totals
+        
+        mask_rate = (total_masks / total_faces * 100) if total_faces > 0 else 0
+        violation_rate = (total_violations / total_faces * 100) if total_faces > 0 else 0
+        
+        return {
+            'detections': detection_count,
+            'total_faces': total_faces,
+            'total_masks': total_masks,
+            'total_violations': total_violations,
+            'mask_rate': round(mask_rate, 2),
+            'violation_rate': round(violation_rate, 2)
+        }
+    
+    def _count_alerts_by(self, session, column, start_date: datetime, end_date: datetime) -> Dict:
+        """Count alerts in range grouped by column"""
+        return dict(session.query(column, func.count(AlertModel.id)).filter(
+            and_(
+                AlertModel.timestamp >= start_date,
+                AlertModel.timestamp <= end_date
+            )
+        ).group_by(column).all())
     
     def get_trends(self, days: int = 7) -> Dict:
         """Get trend analysis for the last N days"""
@@ -319,22 +333,20 @@ class AnalyticsEngine:
         try:
             session = get_db_session()
             
-            # Get recent detections (last hour)
+            # Aggregate recent detections (last hour)
             one_hour_ago = datetime.now() - timedelta(hours=1)
-            recent_detections = session.query(DetectionModel).filter(
+            total_detections, avg_confidence = session.query(
+                func.count(DetectionModel.id),
+                func.avg(func.coalesce(DetectionModel.confidence_score, 0))
+            ).filter(
                 DetectionModel.timestamp >= one_hour_ago
-            ).all()
+            ).one()
+            avg_confidence = float(avg_confidence or 0)
             
-            # Calculate processing metrics
-            total_detections = len(recent_detections)
-            avg_confidence = 0
-            if total_detections > 0:
-                avg_confidence = sum(d.confidence_score or 0 for d in recent_detections) / total_detections
-            
-            # Get system alerts
-            recent_alerts = session.query(AlertModel).filter(
+            # Count system alerts
+            recent_alerts = session.query(func.count(AlertModel.id)).filter(
                 AlertModel.timestamp >= one_hour_ago
-            ).all()
+            ).scalar()
             
             session.close()
             
@@ -342,7 +354,7 @@ class AnalyticsEngine:
                 'last_hour': {
                     'detections': total_detections,
                     'average_confidence': round(avg_confidence, 2),
-                    'alerts': len(recent_alerts)
+                    'alerts': recent_alerts or 0
                 },
                 'system_health': {
                     'database_connected': True,  # If we got here, DB is working
@@ -356,14 +368,16 @@ class AnalyticsEngine:
             return {}
     
     def _calculate_cache_hit_rate(self) -> float:
-        """Calculate cache hit rate (simplified)"""
-        # This is a simplified implementation
-        # In a real system, you'd track cache hits/misses
-        return 85.0  # Placeholder
+        """Calculate analytics cache hit rate as a percentage"""
+        with self._cache_lock:
+            lookups = self._cache_hits + self._cache_misses
+            return round(self._cache_hits / lookups * 100, 2) if lookups > 0 else 0.0
     
     def clear_cache(self):
         """Clear analytics cache"""
-        self.cache.clear()
+        with self._cache_lock:
+            self.cache.clear()
+        self._counter_cache.clear()
         logger.info("Analytics cache cleared")
     
     def export_data(self, format: str = "json", period: str = "today") -> str:
@@ -372,7 +386,7 @@ class AnalyticsEngine:
             data = self.get_analytics(period)
             
             if format.lower() == "json":
-                return json.dumps(data, indent=2, default=str)
+                return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
             elif format.lower() == "csv":
                 # Convert to CSV format (simplified)
                 return self._convert_to_csv(data)
@@ -383,6 +397,47 @@ class AnalyticsEngine:
             logger.error(f"Error exporting data: {e}")
             return ""
     
+    def stream_csv(self, period: str = "today", chunk_rows: int = 1000) -> Iterator[str]:
+        """Stream detections for specified period as CSV chunks"""
+        start_date, end_date = self._get_date_range(period)
+        session = get_db_session()
+        
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow([
+                'id', 'camera_id', 'timestamp', 'face_count',
+                'mask_count', 'no_mask_count', 'confidence_score'
+            ])
+            
+            rows = session.execute(
+                select(
+                    DetectionModel.id,
+                    DetectionModel.camera_id,
+                    DetectionModel.timestamp,
+                    DetectionModel.face_count,
+                    DetectionModel.mask_count,
+                    DetectionModel.no_mask_count,
+                    DetectionModel.confidence_score
+                ).where(
+                    and_(
+                        DetectionModel.timestamp >= start_date,
+                        DetectionModel.timestamp <= end_date
+                    )
+                ).order_by(DetectionModel.timestamp).execution_options(yield_per=chunk_rows)
+            )
+            
+            for i, row in enumerate(rows, 1):
+                writer.writerow(row)
+                if i % chunk_rows == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+            
+            yield buffer.getvalue()
+        finally:
+            session.close()
+    
     def _convert_to_csv(self, data: Dict) -> str:
         """Convert analytics data to CSV format"""
         # This is a simplified CSV conversion
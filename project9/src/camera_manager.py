@@ -3,19 +3,25 @@ Camera Manager - Handles multiple camera streams with multithreading
 """
 
 import cv2
-import json
+import orjson
 import logging
 import threading
 import time
-import queue
+from pathlib import Path
 from typing import Dict, List, Optional
-from datetime import datetime
 
 from .config import Config
 from .database import get_db_session, Camera as CameraModel
 
 logger = logging.getLogger(__name__)
 
+# Consecutive failed reads before a stream reopens its capture
+MAX_READ_FAILURES = 5
+
+# Reopen delays for an unreachable camera, doubling from the first to the cap
+INITIAL_RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
 class CameraStream:
     """Individual camera stream handler"""
     
@@ -31,57 +37,165 @@ class CameraStream:
         self.cap = None
         self.is_running = False
         self.is_active = False
-        self.frame_queue = queue.Queue(maxsize=Config.BUFFER_SIZE)
+        # Latest-frame slot: consumers only ever want the newest frame
+        self.frame_lock = threading.Lock()
+        self.latest_frame = None
+        self.frame_event = threading.Event()
         self.thread = None
         self.fps = 0
         self.total_frames = 0
         self.dropped_frames = 0
+        self.reconnect_requested = False
+        self._stop_event = threading.Event()
+        # Optional consumer called from the stream thread every PROCESSING_INTERVAL
+        self.frame_handler = None
         
     def start(self):
         """Start camera stream"""
-        if self.camera_type == 'ip':
-            self.cap = cv2.VideoCapture(self.url)
-        elif self.camera_type == 'rpi':
-            self.cap = cv2.VideoCapture(self.device_id)
+        self.cap = self._open_capture()
         
         if not self.cap.isOpened():
             raise Exception(f"Failed to open camera {self.camera_id}")
         
         self.is_running = True
         self.is_active = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self._stream_loop, daemon=True)
         self.thread.start()
         logger.info(f"Started camera: {self.camera_id}")
     
+    def _open_capture(self):
+        """Open the capture device for this camera"""
+        if self.camera_type == 'ip':
+            cap = self._open_ip_capture()
+        elif self.camera_type == 'rpi':
+            cap = cv2.VideoCapture(self.device_id)
+        
+        # Keep the backend's own buffer tiny; a deep buffer just serves stale frames
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, min(Config.CAMERA_BUFFER_SIZE, 2))
+        return cap
+    
+    def restart(self):
+        """Restart stream, reopening the capture inside the running stream thread"""
+        if self.is_running and self.thread and self.thread.is_alive():
+            self.reconnect_requested = True
+        else:
+            self.start()
+    
+    def _reconnect(self) -> bool:
+        """Release and reopen the capture device"""
+        logger.warning(f"Reconnecting camera: {self.camera_id}")
+        self.cap.release()
+        cap = self._open_capture()
+        
+        # Opening can block for seconds; drop the new capture if stop() ran meanwhile
+        if self._stop_event.is_set():
+            cap.release()
+            return False
+        
+        self.cap = cap
+        if not self.cap.isOpened():
+            logger.error(f"Failed to reopen camera {self.camera_id}")
+            return False
+        return True
+    
+    def _open_ip_capture(self):
+        """Open IP camera, using a hardware-decoding GStreamer pipeline when configured"""
+        if Config.HW_DECODER and self.url.startswith('rtsp://'):
+            pipeline = (
+                f"rtspsrc location={self.url} latency=200 ! queue ! rtph264depay ! h264parse ! "
+                f"{Config.HW_DECODER} ! videoconvert ! video/x-raw,format=BGR ! "
+                "appsink drop=1 max-buffers=1 sync=false"
+            )
+            cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+            if cap.isOpened():
+                return cap
+            logger.warning(f"GStreamer pipeline failed for camera {self.camera_id}, using default decoder")
+        
+        return cv2.VideoCapture(self.url)
+    
     def stop(self):
         """Stop camera stream"""
         self.is_running = False
+        self._stop_event.set()
         if self.cap:
             self.cap.release()
         logger.info(f"Stopped camera: {self.camera_id}")
     
     def _stream_loop(self):
         """Main streaming loop"""
+        # Bind per-frame lookups once outside the loop
+        read = self.cap.read
+        now_ns = time.time_ns
+        camera_id = self.camera_id
+        retry_delay = 1.0 / Config.FRAME_RATE
+        frame_lock = self.frame_lock
+        frame_event = self.frame_event
+        processing_interval = Config.PROCESSING_INTERVAL
+        last_handled = 0.0
+        
+        failures = 0
+        reconnect_delay = INITIAL_RECONNECT_DELAY
+        
         while self.is_running:
-            ret, frame = self.cap.read()
-            if ret:
-                try:
-                    self.frame_queue.put_nowait({
-                        'frame': frame,
-                        'timestamp': datetime.now(),
-                        'camera_id': self.camera_id
-                    })
-                    self.total_frames += 1
-                except queue.Full:
+            # Reopen only on request or after repeated read failures; transient misses just retry
+            if self.reconnect_requested or failures >= MAX_READ_FAILURES:
+                self.reconnect_requested = False
+                reopened = self._reconnect()
+                if not self.is_running:
+                    break
+                if not reopened:
+                    # Back off while the camera stays unreachable; stop() cuts the wait short
+                    self._stop_event.wait(reconnect_delay)
+                    reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
+                read = self.cap.read
+                failures = 0
+            
+            # cap.read() blocks until the next frame, pacing the loop at the stream's rate
+            ret, frame = read()
+            if not ret or frame is None:
+                failures += 1
+                time.sleep(retry_delay)
+                continue
+            failures = 0
+            reconnect_delay = INITIAL_RECONNECT_DELAY
+            
+            frame_data = {
+                'frame': frame,
+                'timestamp_ns': now_ns(),
+                'camera_id': camera_id
+            }
+            self.total_frames += 1
+            
+            # Push frames to the consumer directly; nobody polls the slot then
+            handler = self.frame_handler
+            if handler is not None:
+                handled_at = time.monotonic()
+                if handled_at - last_handled >= processing_interval:
+                    last_handled = handled_at
+                    handler(frame_data)
+                continue
+            
+            # Overwrite the slot; an unread frame there is dropped as stale
+            with frame_lock:
+                if frame_event.is_set():
                     self.dropped_frames += 1
-            time.sleep(1.0 / Config.FRAME_RATE)
+                self.latest_frame = frame_data
+                frame_event.set()
+        
+        # stop() may have released an earlier capture than the one last opened here
+        self.cap.release()
     
     def get_frame(self, timeout: float = 1.0):
         """Get latest frame"""
-        try:
-            return self.frame_queue.get(timeout=timeout)
-        except queue.Empty:
+        if not self.frame_event.wait(timeout):
             return None
+        
+        with self.frame_lock:
+            frame_data = self.latest_frame
+            self.latest_frame = None
+            self.frame_event.clear()
+        return frame_data
 
 class CameraManager:
     """Manages multiple camera streams"""
@@ -91,11 +205,15 @@ class CameraManager:
         self.is_running = False
         self._load_cameras()
     
+    def set_frame_handler(self, handler):
+        """Deliver frames from every camera's stream thread to handler"""
+        for camera in self.cameras.values():
+            camera.frame_handler = handler
+    
     def _load_cameras(self):
         """Load camera configuration"""
         try:
-            with open(Config.CAMERA_CONFIG_PATH, 'r') as f:
-                config = json.load(f)
+            config = orjson.loads(Path(Config.CAMERA_CONFIG_PATH).read_bytes())
             
             for camera_config in config.get('cameras', []):
                 camera = CameraStream(
@@ -147,6 +265,5 @@ class CameraManager:
     
     def restart_camera(self, camera_id: str):
         """Restart specific camera"""
-        self.stop_camera(camera_id)
-        time.sleep(1)
-        self.start_camera(camera_id)
+        if camera_id in self.cameras:
+            self.cameras[camera_id].restart()
@@ -3,7 +3,7 @@ Database module for Face Mask Detection System
 """
 
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Float, Text
+from sqlalchemy import create_engine, make_url, text, Column, Index, Integer, String, DateTime, Boolean, Float, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool
@@ -14,18 +14,27 @@ from .config import Config
 
 logger = logging.getLogger(__name__)
 
+# psycopg2 folds executemany() into multi-row VALUES pages
+driver_options = {}
+if make_url(Config.DATABASE_URL).get_driver_name() == 'psycopg2':
+    driver_options = {
+        'executemany_mode': 'values_plus_batch',
+        'executemany_batch_page_size': 500
+    }
+
 # Create SQLAlchemy engine with connection pooling
 engine = create_engine(
     Config.DATABASE_URL,
     poolclass=QueuePool,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
     pool_pre_ping=True,
-    pool_recycle=3600
+    pool_recycle=3600,
+    **driver_options
 )
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 session_factory = scoped_session(SessionLocal)
 
 # Create base class for models
@@ -58,6 +67,10 @@ def get_db():
     finally:
         session.close()
 
+def remove_db_session(exception=None):
+    """Release the current thread's scoped session back to the pool"""
+    session_factory.remove()
+
 def close_db():
     """Close database connections"""
     session_factory.remove()
@@ -96,10 +109,13 @@ class Camera(Base):
 class Detection(Base):
     """Detection model"""
     __tablename__ = "detections"
+    __table_args__ = (
+        Index('ix_detections_camera_time', 'camera_id', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     camera_id = Column(String(50), nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     face_count = Column(Integer, default=0)
     mask_count = Column(Integer, default=0)
     no_mask_count = Column(Integer, default=0)
@@ -124,6 +140,10 @@ class Detection(Base):
 class Alert(Base):
     """Alert model"""
     __tablename__ = "alerts"
+    __table_args__ = (
+        Index('ix_alerts_camera_time', 'camera_id', 'timestamp'),
+        Index('ix_alerts_unacknowledged', 'timestamp', postgresql_where=text('acknowledged = false')),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     camera_id = Column(String(50), nullable=False)
@@ -158,7 +178,7 @@ class SystemLog(Base):
     component = Column(String(50), nullable=False)  # 'camera', 'detection', 'telegram', 'mqtt'
     message = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
-    metadata = Column(Text)  # JSON string for additional data
+    extra_metadata = Column("metadata", Text)  # JSON string for additional data
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -168,5 +188,5 @@ class SystemLog(Base):
             'component': self.component,
             'message': self.message,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-            'metadata': self.metadata
+            'metadata': self.extra_metadata
         }
@@ -9,21 +9,45 @@ import logging
 import threading
 import time
 import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from collections import deque
 from typing import List, Dict, Tuple
 from datetime import datetime
 import os
+import csv
+import io
 
 from .config import Config
-from .database import get_db_session, Detection as DetectionModel
+from .database import engine, Detection as DetectionModel
 
 logger = logging.getLogger(__name__)
 
+# Column order for COPY-based detection inserts; COPY skips Python-side column defaults
+_COPY_COLUMNS = ('camera_id', 'timestamp', 'face_count', 'mask_count', 'no_mask_count', 'confidence_score', 'processed')
+
+# Dead detection worker processes restarted before the engine gives up on them
+MAX_WORKER_RESTARTS = 5
+
+class _FrameCounter:
+    """Frames processed by a single worker thread"""
+    __slots__ = ('frames',)
+    
+    def __init__(self):
+        self.frames = 0
+
 class FaceMaskDetector:
     """AI model for face mask detection"""
     
     def __init__(self):
         self.model = None
+        self.interpreter = None
+        self._infer = None
+        self._input_dtype = np.float32
         self.face_cascade = None
+        self.face_net = None
+        # Per-thread scratch buffers; detection workers share this detector
+        self._buffers = threading.local()
         self.confidence_threshold = Config.CONFIDENCE_THRESHOLD
         self._load_models()
     
@@ -31,15 +55,37 @@ class FaceMaskDetector:
         """Load AI models"""
         try:
             # Load face detection model
-            if os.path.exists(Config.FACE_DETECTION_MODEL):
+            if Config.USE_DNN_FACE and os.path.exists(Config.FACE_DNN_MODEL):
+                self._load_face_net()
+            elif os.path.exists(Config.FACE_DETECTION_MODEL):
                 self.face_cascade = cv2.CascadeClassifier(Config.FACE_DETECTION_MODEL)
             else:
                 # Use default OpenCV face detection
                 self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
             
-            # Load mask detection model
-            if os.path.exists(Config.MODEL_PATH):
+            # Load mask detection model, preferring the quantized TFLite build
+            if os.path.exists(Config.TFLITE_MODEL_PATH):
+                self.interpreter = tf.lite.Interpreter(
+                    model_path=Config.TFLITE_MODEL_PATH,
+                    num_threads=Config.MAX_WORKERS
+                )
+                self._input_details = self.interpreter.get_input_details()[0]
+                self._output_details = self.interpreter.get_output_details()[0]
+                self._interpreter_batch = 0
+                # Interpreter tensors are shared state; worker threads take turns
+                self._interpreter_lock = threading.Lock()
+                logger.info("Loaded TFLite mask detection model")
+            elif os.path.exists(Config.MODEL_PATH):
                 self.model = tf.keras.models.load_model(Config.MODEL_PATH)
+                if Config.MODEL_FP16:
+                    self.model = self._to_fp16(self.model)
+                    self._input_dtype = np.float16
+                
+                # Trace inference once; the batch axis is left open so face count doesn't retrace
+                self._infer = tf.function(
+                    lambda x: self.model(x, training=False),
+                    input_signature=[tf.TensorSpec((None, 224, 224, 3), tf.as_dtype(self._input_dtype))]
+                )
                 logger.info("Loaded pre-trained mask detection model")
             else:
                 logger.warning("No pre-trained model found, using basic detection")
@@ -49,57 +95,184 @@ class FaceMaskDetector:
             logger.error(f"Failed to load models: {e}")
             raise
     
+    def _load_face_net(self):
+        """Load the ONNX face detector on CUDA when available, CPU otherwise"""
+        self.face_net = cv2.dnn.readNetFromONNX(Config.FACE_DNN_MODEL)
+        if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+            self.face_net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+            self.face_net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+        else:
+            self.face_net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.face_net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self._face_net_outputs = self.face_net.getUnconnectedOutLayersNames()
+        self._face_confidence = Config.FACE_DNN_CONFIDENCE
+        # A Net holds its input blob, so worker threads take turns
+        self._face_net_lock = threading.Lock()
+        logger.info("Loaded DNN face detection model")
+    
+    @staticmethod
+    def _to_fp16(model):
+        """Clone a Keras model with float16 weights and compute"""
+        fp16_model = tf.keras.models.clone_model(
+            model,
+            clone_function=lambda layer: layer.__class__.from_config({**layer.get_config(), 'dtype': 'float16'})
+        )
+        fp16_model.set_weights([w.astype(np.float16) for w in model.get_weights()])
+        return fp16_model
+    
     def detect_faces(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
         """Detect faces in frame"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.face_net is not None:
+            return self._detect_faces_dnn(frame)
+        
+        # Run the cascade at roughly 640px wide; its cost scales with pixel count
+        scale = max(1, min(frame.shape[1] // 640, 4))
+        
+        gray = self._buffer('gray', frame.shape[:2])
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        if scale > 1:
+            small = self._buffer('gray_small', (gray.shape[0] // scale, gray.shape[1] // scale))
+            cv2.resize(gray, (small.shape[1], small.shape[0]), dst=small, interpolation=cv2.INTER_AREA)
+            gray = small
+        
         faces = self.face_cascade.detectMultiScale(
             gray, 
             scaleFactor=1.1, 
             minNeighbors=5, 
-            minSize=(30, 30)
+            minSize=(30 // scale, 30 // scale)
         )
+        
+        # Map boxes back to full-resolution coordinates
+        if scale > 1 and len(faces) > 0:
+            faces = faces * scale
         return faces
     
+    def _buffer(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """Return this thread's scratch buffer, reallocating only on shape change"""
+        buf = getattr(self._buffers, name, None)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            setattr(self._buffers, name, buf)
+        return buf
+    
+    def _batch_buffer(self, name: str, size: int, dtype) -> np.ndarray:
+        """Return the first `size` rows of this thread's 224x224 face batch, growing it as needed"""
+        buf = getattr(self._buffers, name, None)
+        if buf is None or buf.shape[0] < size or buf.dtype != dtype:
+            buf = self._buffer(name, (max(size, 8), 224, 224, 3), dtype)
+        return buf[:size]
+    
+    def _detect_faces_dnn(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """Detect faces with the UltraFace ONNX model"""
+        height, width = frame.shape[:2]
+        blob = cv2.dnn.blobFromImage(frame, 1 / 128.0, (320, 240), (127, 127, 127), swapRB=True)
+        
+        with self._face_net_lock:
+            self.face_net.setInput(blob)
+            outputs = self.face_net.forward(self._face_net_outputs)
+        
+        # UltraFace emits per-anchor class scores (N, 2) and normalized corner boxes (N, 4)
+        scores, boxes = sorted((out.reshape(-1, out.shape[-1]) for out in outputs), key=lambda out: out.shape[1])
+        keep = scores[:, 1] > self._face_confidence
+        if not keep.any():
+            return []
+        
+        boxes = boxes[keep] * np.array([width, height, width, height], dtype=np.float32)
+        boxes = np.clip(boxes, 0, [width, height, width, height]).astype(int)
+        rects = [(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in boxes.tolist()]
+        confidences = scores[keep, 1].tolist()
+        
+        indices = cv2.dnn.NMSBoxes(rects, confidences, self._face_confidence, 0.3)
+        return [rects[i] for i in np.array(indices).flatten() if rects[i][2] > 0 and rects[i][3] > 0]
+    
     def predict_mask(self, face_roi: np.ndarray) -> Tuple[str, float]:
         """Predict if face has mask"""
-        if self.model is None:
+        return self.predict_masks([face_roi])[0]
+    
+    def predict_masks(self, face_rois: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """Predict mask status for all faces in a single model call"""
+        if self.model is None and self.interpreter is None:
             # Basic heuristic detection (placeholder)
-            return self._basic_mask_detection(face_roi)
+            return [self._basic_mask_detection(cv2.cvtColor(face_roi, cv2.COLOR_BGR2HSV)) for face_roi in face_rois]
         
         try:
-            # Preprocess image
-            face_roi = cv2.resize(face_roi, (224, 224))
-            face_roi = face_roi / 255.0
-            face_roi = np.expand_dims(face_roi, axis=0)
-            
-            # Predict
-            prediction = self.model.predict(face_roi, verbose=0)
-            confidence = float(prediction[0][0])
+            # Resize into a reused uint8 batch, then scale into the model's dtype in one pass
+            resized = self._batch_buffer('resized', len(face_rois), np.uint8)
+            for i, face_roi in enumerate(face_rois):
+                cv2.resize(face_roi, (224, 224), dst=resized[i])
+            batch = self._batch_buffer('batch', len(face_rois), self._input_dtype)
+            np.multiply(resized, self._input_dtype(1 / 255.0), out=batch)
             
-            if confidence > self.confidence_threshold:
-                return "mask", confidence
+            if self.interpreter is not None:
+                predictions = self._invoke_interpreter(batch)
             else:
-                return "no_mask", 1 - confidence
+                # Predict through the traced graph instead of Keras predict()
+                predictions = self._infer(tf.constant(batch)).numpy()
+            
+            return [self._classify_mask(float(prediction[0])) for prediction in predictions]
                 
         except Exception as e:
             logger.error(f"Error in mask prediction: {e}")
-            return "unknown", 0.0
+            return [("unknown", 0.0)] * len(face_rois)
     
-    def _basic_mask_detection(self, face_roi: np.ndarray) -> Tuple[str, float]:
-        """Basic mask detection using color analysis"""
-        # Convert to HSV
-        hsv = cv2.cvtColor(face_roi, cv2.COLOR_BGR2HSV)
+    def _invoke_interpreter(self, batch: np.ndarray) -> np.ndarray:
+        """Run a float batch through the TFLite interpreter"""
+        input_details = self._input_details
+        output_details = self._output_details
+        
+        # Quantize inputs for INT8 models
+        if input_details['dtype'] in (np.uint8, np.int8):
+            scale, zero_point = input_details['quantization']
+            dtype_info = np.iinfo(input_details['dtype'])
+            batch = np.clip(np.round(batch / scale + zero_point), dtype_info.min, dtype_info.max)
+            batch = batch.astype(input_details['dtype'])
+        
+        with self._interpreter_lock:
+            # Resize the input tensor only when the face count changes
+            if batch.shape[0] != self._interpreter_batch:
+                self.interpreter.resize_tensor_input(input_details['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._interpreter_batch = batch.shape[0]
+            
+            self.interpreter.set_tensor(input_details['index'], batch)
+            self.interpreter.invoke()
+            predictions = self.interpreter.get_tensor(output_details['index'])
         
-        # Define skin color range
-        lower_skin = np.array([0, 20, 70])
-        upper_skin = np.array([20, 255, 255])
+        # Dequantize outputs back to probabilities
+        if output_details['dtype'] in (np.uint8, np.int8):
+            scale, zero_point = output_details['quantization']
+            predictions = (predictions.astype(np.float32) - zero_point) * scale
         
-        # Create mask for skin color
-        skin_mask = cv2.inRange(hsv, lower_skin, upper_skin)
+        return predictions
+    
+    def _classify_mask(self, confidence: float) -> Tuple[str, float]:
+        """Map model output to mask status and confidence"""
+        if confidence > self.confidence_threshold:
+            return "mask", confidence
+        else:
+            return "no_mask", 1 - confidence
+    
+    def _basic_mask_detections(self, frame: np.ndarray, faces) -> List[Tuple[str, float]]:
+        """Run the color heuristic on all faces with a single HSV conversion"""
+        # Convert only the region spanning every face, then slice each face out of it
+        x0 = min(x for (x, y, w, h) in faces)
+        y0 = min(y for (x, y, w, h) in faces)
+        x1 = max(x + w for (x, y, w, h) in faces)
+        y1 = max(y + h for (x, y, w, h) in faces)
+        hsv = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
+        
+        return [
+            self._basic_mask_detection(hsv[y - y0:y - y0 + h, x - x0:x - x0 + w])
+            for (x, y, w, h) in faces
+        ]
+    
+    def _basic_mask_detection(self, hsv: np.ndarray) -> Tuple[str, float]:
+        """Basic mask detection using color analysis of an HSV face region"""
+        # Count skin-colored pixels (H <= 20, S >= 20, V >= 70) without building a mask image
+        skin_pixels = np.count_nonzero((hsv[..., 0] <= 20) & (hsv[..., 1] >= 20) & (hsv[..., 2] >= 70))
         
         # Calculate skin percentage
-        skin_pixels = cv2.countNonZero(skin_mask)
-        total_pixels = face_roi.shape[0] * face_roi.shape[1]
+        total_pixels = hsv.shape[0] * hsv.shape[1]
         skin_percentage = skin_pixels / total_pixels
         
         # Simple heuristic: if skin percentage is high, likely no mask
@@ -128,13 +301,15 @@ class FaceMaskDetector:
             
             total_confidence = 0.0
             
-            for (x, y, w, h) in faces:
-                # Extract face ROI
-                face_roi = frame[y:y+h, x:x+w]
-                
-                # Predict mask
-                mask_status, confidence = self.predict_mask(face_roi)
-                
+            if self.model is None and self.interpreter is None:
+                # No model loaded; the color heuristic needs HSV, the models don't
+                predictions = self._basic_mask_detections(frame, faces)
+            else:
+                # Extract face ROIs and predict masks in one batch
+                face_rois = [frame[y:y+h, x:x+w] for (x, y, w, h) in faces]
+                predictions = self.predict_masks(face_rois)
+            
+            for (x, y, w, h), (mask_status, confidence) in zip(faces, predictions):
                 detection = {
                     'bbox': (x, y, w, h),
                     'mask_status': mask_status,
@@ -158,23 +333,72 @@ class FaceMaskDetector:
         
         return results
 
+def _detection_process(shm_name: str, slot_size: int, task_queue, output_queue, worker_slots, index: int):
+    """Detection worker process reading frames from shared memory"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    detector = FaceMaskDetector()
+    
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            
+            # Record the slot in hand so the parent can reclaim it if this process dies
+            slot, shape, dtype = task
+            worker_slots[index] = slot
+            
+            # View the frame in place; only the result dict crosses back
+            frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=slot * slot_size)
+            detection_results = detector.process_frame(frame)
+            del frame
+            
+            output_queue.put((slot, detection_results))
+            worker_slots[index] = -1
+    finally:
+        shm.close()
+
 class DetectionEngine:
     """Main detection engine with multithreading"""
     
     def __init__(self):
         self.detector = FaceMaskDetector()
         self.is_running = False
-        self.frame_queue = queue.Queue(maxsize=Config.QUEUE_SIZE)
-        self.result_queue = queue.Queue(maxsize=Config.QUEUE_SIZE)
+        self.frame_queue = queue.Queue(maxsize=Config.DETECTION_QUEUE_SIZE)
+        # Ring buffer of results; when full, appending evicts the oldest
+        self.result_queue = deque(maxlen=Config.QUEUE_SIZE)
+        self.results_ready = threading.Event()
         self.worker_threads = []
         self.max_workers = Config.MAX_WORKERS
         
-        # Statistics
+        # Process mode: frames are handed to worker processes via shared memory slots
+        self.use_processes = Config.DETECTION_USE_PROCESSES
+        self.worker_processes = []
+        self._shm = None
+        self._slot_size = Config.MAX_FRAME_BYTES
+        self._free_slots = None
+        self._slot_frames = []
+        self._task_queue = None
+        self._output_queue = None
+        self._worker_slots = None
+        self._worker_restarts = 0
+        
+        # Detection rows waiting to be bulk-inserted by the flusher thread
+        self._pending = deque()
+        self._pending_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flusher_thread = None
+        self._flush_size = Config.DB_FLUSH_SIZE
+        
+        # Statistics; each thread counts into its own counter, reduced once a second
         self.total_frames_processed = 0
         self.total_detections = 0
         self.processing_fps = 0
         self.last_fps_update = time.time()
-        self.frames_since_update = 0
+        self._stats_local = threading.local()
+        self._frame_counters = []
+        self._counters_lock = threading.Lock()
+        self._stats_thread = None
     
     def start(self):
         """Start detection engine"""
@@ -183,112 +407,317 @@ class DetectionEngine:
         
         self.is_running = True
         
-        # Start worker threads
-        for i in range(self.max_workers):
-            thread = threading.Thread(target=self._worker_loop, daemon=True, name=f"DetectionWorker-{i}")
-            thread.start()
-            self.worker_threads.append(thread)
+        if self.use_processes:
+            self._start_processes()
+        else:
+            # Start worker threads
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._worker_loop, daemon=True, name=f"DetectionWorker-{i}")
+                thread.start()
+                self.worker_threads.append(thread)
+        
+        # Start database flusher
+        self._flusher_thread = threading.Thread(target=self._flush_loop, daemon=True, name="DetectionFlusher")
+        self._flusher_thread.start()
+        
+        # Start statistics reducer
+        self._stats_thread = threading.Thread(target=self._stats_loop, daemon=True, name="DetectionStats")
+        self._stats_thread.start()
         
         logger.info(f"Started detection engine with {self.max_workers} workers")
     
+    def _start_processes(self):
+        """Start detection worker processes sharing a frame slot buffer"""
+        ctx = mp.get_context('spawn')
+        num_slots = Config.DETECTION_QUEUE_SIZE
+        
+        self._shm = shared_memory.SharedMemory(create=True, size=num_slots * self._slot_size)
+        self._free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+        self._slot_frames = [None] * num_slots
+        self._task_queue = ctx.Queue()
+        self._output_queue = ctx.Queue()
+        # Slot each worker is processing, -1 when idle
+        self._worker_slots = ctx.Array('i', [-1] * self.max_workers, lock=False)
+        self._worker_restarts = 0
+        
+        for i in range(self.max_workers):
+            self.worker_processes.append(self._spawn_worker(ctx, i))
+        
+        # Collect results from the worker processes
+        thread = threading.Thread(target=self._collector_loop, daemon=True, name="DetectionCollector")
+        thread.start()
+        self.worker_threads.append(thread)
+    
+    def _spawn_worker(self, ctx, index: int):
+        """Start the detection worker process for index"""
+        process = ctx.Process(
+            target=_detection_process,
+            args=(self._shm.name, self._slot_size, self._task_queue, self._output_queue, self._worker_slots, index),
+            daemon=True,
+            name=f"DetectionWorker-{index}"
+        )
+        process.start()
+        return process
+    
+    def _check_workers(self):
+        """Reclaim the slot of any dead worker process and restart it"""
+        for index, process in enumerate(self.worker_processes):
+            if process is None or process.is_alive():
+                continue
+            
+            logger.error(f"Detection worker {process.name} exited with code {process.exitcode}")
+            
+            # Return the frame slot it was holding to the pool
+            slot = self._worker_slots[index]
+            self._worker_slots[index] = -1
+            if slot >= 0 and self._slot_frames[slot] is not None:
+                self._slot_frames[slot] = None
+                self._free_slots.put(slot)
+            
+            if self._worker_restarts >= MAX_WORKER_RESTARTS:
+                logger.error(f"Not restarting {process.name}: {MAX_WORKER_RESTARTS} worker restarts reached")
+                self.worker_processes[index] = None
+                continue
+            
+            self._worker_restarts += 1
+            self.worker_processes[index] = self._spawn_worker(mp.get_context('spawn'), index)
+            logger.info(f"Restarted detection worker {process.name}")
+    
     def stop(self):
         """Stop detection engine"""
         self.is_running = False
+        self._flush_event.set()
         
         # Wait for threads to finish
         for thread in self.worker_threads:
             thread.join(timeout=5)
         
         self.worker_threads.clear()
+        
+        for thread in (self._flusher_thread, self._stats_thread):
+            if thread:
+                thread.join(timeout=5)
+        self._flusher_thread = None
+        self._stats_thread = None
+        
+        if self.worker_processes:
+            for _ in self.worker_processes:
+                self._task_queue.put(None)
+            for process in self.worker_processes:
+                if process is not None:
+                    process.join(timeout=5)
+            
+            self.worker_processes.clear()
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        
+        # Workers may have queued detections after the flusher's final pass
+        self._flush_detections()
         logger.info("Stopped detection engine")
     
     def add_frame(self, frame_data: Dict):
         """Add frame to processing queue"""
+        if self.use_processes:
+            self._add_shared_frame(frame_data)
+            return
+        
         try:
             self.frame_queue.put_nowait(frame_data)
         except queue.Full:
             logger.warning("Frame queue full, dropping frame")
     
-    def get_results(self, timeout: float = 1.0) -> List[Dict]:
-        """Get detection results"""
-        results = []
+    def _add_shared_frame(self, frame_data: Dict):
+        """Copy frame into a free shared memory slot for the worker processes"""
+        frame = frame_data['frame']
+        if frame.nbytes > self._slot_size:
+            logger.warning(f"Frame of {frame.nbytes} bytes exceeds MAX_FRAME_BYTES, dropping frame")
+            return
+        
         try:
-            while True:
-                result = self.result_queue.get_nowait()
-                results.append(result)
+            slot = self._free_slots.get_nowait()
         except queue.Empty:
-            pass
+            logger.warning("Frame queue full, dropping frame")
+            return
+        
+        slot_view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._shm.buf, offset=slot * self._slot_size)
+        slot_view[...] = frame
+        self._slot_frames[slot] = frame_data
+        self._task_queue.put((slot, frame.shape, frame.dtype.str))
+    
+    def get_results(self, timeout: float = 1.0) -> List[Dict]:
+        """Wait up to timeout for detection results, then drain all available"""
+        self.results_ready.wait(timeout)
+        self.results_ready.clear()
+        
+        results = []
+        while True:
+            try:
+                results.append(self.result_queue.popleft())
+            except IndexError:
+                break
         return results
     
     def _worker_loop(self):
         """Worker thread loop"""
+        # Bind per-frame lookups once outside the loop
+        get = self.frame_queue.get
+        process = self.detector.process_frame
+        handle = self._handle_results
+        
         while self.is_running:
             try:
                 # Get frame from queue
-                frame_data = self.frame_queue.get(timeout=1.0)
-                
-                # Process frame
-                frame = frame_data['frame']
-                camera_id = frame_data['camera_id']
-                timestamp = frame_data['timestamp']
+                frame_data = get(timeout=1.0)
                 
                 # Detect faces and masks
-                detection_results = self.detector.process_frame(frame)
+                detection_results = process(frame_data['frame'])
                 
-                # Add metadata
-                detection_results.update({
-                    'camera_id': camera_id,
-                    'timestamp': timestamp,
-                    'frame_shape': frame.shape
-                })
+                handle(detection_results, frame_data)
                 
-                # Save to database
-                self._save_detection(detection_results)
+            except queue.Empty:
+                continue
+            except Exception as e:
+                logger.error(f"Error in detection worker: {e}")
+    
+    def _collector_loop(self):
+        """Collect results from worker processes and release their frame slots"""
+        last_check = time.monotonic()
+        
+        while self.is_running:
+            try:
+                # A dead worker would otherwise hold its slot forever
+                now = time.monotonic()
+                if now - last_check >= 1.0:
+                    last_check = now
+                    self._check_workers()
                 
-                # Add to result queue
-                try:
-                    self.result_queue.put_nowait(detection_results)
-                except queue.Full:
-                    logger.warning("Result queue full, dropping result")
+                slot, detection_results = self._output_queue.get(timeout=1.0)
                 
-                # Update statistics
-                self._update_statistics()
+                frame_data = self._slot_frames[slot]
+                if frame_data is None:
+                    # Slot already reclaimed from a worker that died after reporting
+                    continue
+                self._slot_frames[slot] = None
+                self._free_slots.put(slot)
+                
+                self._handle_results(detection_results, frame_data)
                 
             except queue.Empty:
                 continue
             except Exception as e:
-                logger.error(f"Error in detection worker: {e}")
+                logger.error(f"Error in detection collector: {e}")
+    
+    def _handle_results(self, detection_results: Dict, frame_data: Dict):
+        """Attach frame metadata, persist and publish detection results"""
+        # Add metadata
+        detection_results.update({
+            'camera_id': frame_data['camera_id'],
+            'timestamp_ns': frame_data['timestamp_ns'],
+            'frame_shape': frame_data['frame'].shape
+        })
+        
+        # Save to database
+        self._save_detection(detection_results)
+        
+        # Add to result queue, dropping the oldest result when full
+        self.result_queue.append(detection_results)
+        self.results_ready.set()
+        
+        # Update statistics
+        self._update_statistics()
     
     def _save_detection(self, detection_results: Dict):
-        """Save detection to database"""
+        """Queue detection for the next bulk insert"""
+        row = {
+            'camera_id': detection_results['camera_id'],
+            'timestamp_ns': detection_results['timestamp_ns'],
+            'face_count': detection_results['faces_detected'],
+            'mask_count': detection_results['masks_detected'],
+            'no_mask_count': detection_results['no_masks_detected'],
+            'confidence_score': detection_results['confidence_score'],
+            'processed': False
+        }
+        
+        with self._pending_lock:
+            self._pending.append(row)
+            pending = len(self._pending)
+        
+        if pending >= self._flush_size:
+            self._flush_event.set()
+    
+    def _flush_loop(self):
+        """Bulk-insert queued detections every flush interval or once a batch fills"""
+        flush_interval = Config.DB_FLUSH_INTERVAL
+        flush_event = self._flush_event
+        
+        while self.is_running:
+            flush_event.wait(timeout=flush_interval)
+            flush_event.clear()
+            self._flush_detections()
+        
+        # Write whatever was queued before shutdown
+        self._flush_detections()
+    
+    def _flush_detections(self):
+        """Write all queued detections in a single transaction"""
+        with self._pending_lock:
+            if not self._pending:
+                return
+            rows = list(self._pending)
+            self._pending.clear()
+        
+        # Frames carry integer capture times; build datetimes only for the rows being written
+        for row in rows:
+            row['timestamp'] = datetime.fromtimestamp(row.pop('timestamp_ns') / 1e9)
+        
         try:
-            session = get_db_session()
-            
-            detection = DetectionModel(
-                camera_id=detection_results['camera_id'],
-                timestamp=detection_results['timestamp'],
-                face_count=detection_results['faces_detected'],
-                mask_count=detection_results['masks_detected'],
-                no_mask_count=detection_results['no_masks_detected'],
-                confidence_score=detection_results['confidence_score']
-            )
-            
-            session.add(detection)
-            session.commit()
-            session.close()
-            
+            if engine.dialect.driver == 'psycopg2':
+                self._copy_detections(rows)
+            else:
+                with engine.begin() as conn:
+                    conn.execute(DetectionModel.__table__.insert(), rows)
         except Exception as e:
-            logger.error(f"Failed to save detection: {e}")
+            logger.error(f"Failed to save {len(rows)} detections: {e}")
+    
+    def _copy_detections(self, rows: List[Dict]):
+        """Stream detections into Postgres with COPY instead of parameterized INSERTs"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in _COPY_COLUMNS])
+        buffer.seek(0)
+        
+        conn = engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.copy_expert(f"COPY detections ({', '.join(_COPY_COLUMNS)}) FROM STDIN WITH CSV", buffer)
+            conn.commit()
+        finally:
+            conn.close()
     
     def _update_statistics(self):
-        """Update processing statistics"""
-        self.total_frames_processed += 1
-        self.frames_since_update += 1
-        
-        current_time = time.time()
-        if current_time - self.last_fps_update >= 1.0:
-            self.processing_fps = self.frames_since_update / (current_time - self.last_fps_update)
-            self.frames_since_update = 0
+        """Count a processed frame on the calling thread's own counter"""
+        counter = getattr(self._stats_local, 'counter', None)
+        if counter is None:
+            counter = self._stats_local.counter = _FrameCounter()
+            with self._counters_lock:
+                self._frame_counters.append(counter)
+        counter.frames += 1
+    
+    def _stats_loop(self):
+        """Reduce per-thread frame counters into the public statistics once a second"""
+        while self.is_running:
+            time.sleep(1.0)
+            
+            with self._counters_lock:
+                total = sum(counter.frames for counter in self._frame_counters)
+            
+            current_time = time.time()
+            self.processing_fps = (total - self.total_frames_processed) / (current_time - self.last_fps_update)
+            self.total_frames_processed = total
             self.last_fps_update = current_time
     
     def get_statistics(self) -> Dict:
@@ -297,11 +726,23 @@ class DetectionEngine:
             'is_running': self.is_running,
             'total_frames_processed': self.total_frames_processed,
             'processing_fps': round(self.processing_fps, 2),
-            'queue_size': self.frame_queue.qsize(),
-            'result_queue_size': self.result_queue.qsize(),
-            'active_workers': len([t for t in self.worker_threads if t.is_alive()])
+            'queue_size': self._pending_frames(),
+            'result_queue_size': len(self.result_queue),
+            'active_workers': self._active_workers()
         }
     
+    def _pending_frames(self) -> int:
+        """Get number of frames waiting for or under processing"""
+        if self.use_processes:
+            return len(self._slot_frames) - self._free_slots.qsize() if self._free_slots else 0
+        return self.frame_queue.qsize()
+    
+    def _active_workers(self) -> int:
+        """Get number of live worker threads or processes"""
+        if self.use_processes:
+            return len([p for p in self.worker_processes if p is not None and p.is_alive()])
+        return len([t for t in self.worker_threads if t.is_alive()])
+    
     def process_single_frame(self, frame: np.ndarray) -> Dict:
         """Process a single frame (for testing)"""
         return self.detector.process_frame(frame)
@@ -3,16 +3,62 @@ MQTT Client - IoT device communication and control
 """
 
 import logging
-import json
+import orjson
+import msgpack
+import socket
 import threading
 import time
-from typing import Dict, Callable, Any
+from functools import lru_cache
+from typing import Dict, List, Tuple, Callable, Any
 import paho.mqtt.client as mqtt
 
 from .config import Config
 
 logger = logging.getLogger(__name__)
 
+_OK = mqtt.MQTT_ERR_SUCCESS
+
+# Last will payload; the broker only sends it on an unexpected disconnect, so a fixed timestamp is fine
+_WILL_PAYLOAD = orjson.dumps({"status": "offline", "timestamp": 0})
+
+def _msgpack_default(obj):
+    """Convert numpy scalars and arrays that msgpack cannot pack natively"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+class _TopicNode:
+    """Node in the subscription trie, one per topic filter segment"""
+    __slots__ = ('children', 'handlers')
+    
+    def __init__(self):
+        self.children: Dict[str, '_TopicNode'] = {}
+        self.handlers: Tuple[Callable[[str, Dict], Any], ...] = ()
+
+@lru_cache(maxsize=1024)
+def _split_topic(topic: str) -> tuple:
+    """Split topic into segments, cached for repeat topics"""
+    return tuple(topic.split('/'))
+
+def _match_topic(node: _TopicNode, segments: tuple, index: int, matched: list):
+    """Collect handlers of every filter in the trie matching the topic segments"""
+    # '#' matches the parent level and everything below it
+    multi = node.children.get('#')
+    if multi is not None:
+        matched.extend(multi.handlers)
+    
+    if index == len(segments):
+        matched.extend(node.handlers)
+        return
+    
+    child = node.children.get(segments[index])
+    if child is not None:
+        _match_topic(child, segments, index + 1, matched)
+    
+    single = node.children.get('+')
+    if single is not None:
+        _match_topic(single, segments, index + 1, matched)
+
 class MQTTClient:
     """MQTT client for IoT device communication"""
     
@@ -25,8 +71,25 @@ class MQTTClient:
         self.password = Config.MQTT_PASSWORD
         self.topic_prefix = Config.MQTT_TOPIC_PREFIX
         
-        # Message handlers
-        self.message_handlers = {}
+        # Full topics built once; per-camera and per-type topics are cached on first use
+        self._status_topic = f"{self.topic_prefix}/status"
+        self._batch_topic = f"{self.topic_prefix}/detections/batch"
+        self._batch_binary_topic = f"{self._batch_topic}/msgpack"
+        self._detection_topics = {}
+        self._alert_topics = {}
+        
+        # Message handlers, indexed by topic filter segments for wildcard dispatch.
+        # Handler tuples are immutable snapshots replaced on every change.
+        self.message_handlers: Dict[str, Tuple[Callable[[str, Dict], Any], ...]] = {}
+        self._handler_trie = _TopicNode()
+        
+        # Detections waiting to be published as one batch
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.batch_size = Config.MQTT_BATCH_SIZE
+        self.batch_interval = Config.MQTT_BATCH_INTERVAL
+        self.binary = Config.MQTT_BINARY
         
         # Statistics
         self.messages_sent = 0
@@ -37,6 +100,7 @@ class MQTTClient:
         self.auto_reconnect = True
         self.reconnect_delay = 5
         self.max_reconnect_attempts = 10
+        self._reconnect_pending = threading.Event()
         
         if self.broker and self.port:
             self._setup_client()
@@ -52,18 +116,14 @@ class MQTTClient:
             self.client.on_message = self._on_message
             self.client.on_publish = self._on_publish
             self.client.on_subscribe = self._on_subscribe
+            self.client.on_socket_open = self._on_socket_open
             
             # Set authentication if provided
             if self.username and self.password:
                 self.client.username_pw_set(self.username, self.password)
             
             # Set will message
-            will_topic = f"{self.topic_prefix}/status"
-            will_message = json.dumps({
-                "status": "offline",
-                "timestamp": time.time()
-            })
-            self.client.will_set(will_topic, will_message, qos=1, retain=True)
+            self.client.will_set(self._status_topic, _WILL_PAYLOAD, qos=1, retain=True)
             
             logger.info("MQTT client setup completed")
             
@@ -110,8 +170,11 @@ class MQTTClient:
             # Subscribe to topics
             self._subscribe_to_topics()
             
-            # Publish online status
-            self.publish_status("online")
+            # Publish online status; publish() raises, and an escaping error would kill paho's network thread
+            try:
+                self.publish_status("online")
+            except Exception as e:
+                logger.error(f"Error publishing online status: {e}")
             
         else:
             self.is_connected = False
@@ -125,33 +188,51 @@ class MQTTClient:
         # Auto-reconnect
         if self.auto_reconnect and rc != 0:
             if self.connection_attempts < self.max_reconnect_attempts:
+                # paho can report one drop several times; keep a single reconnect in flight
+                if self._reconnect_pending.is_set():
+                    return
+                self._reconnect_pending.set()
                 logger.info(f"Attempting to reconnect in {self.reconnect_delay} seconds...")
-                threading.Timer(self.reconnect_delay, self.connect).start()
+                threading.Timer(self.reconnect_delay, self._do_reconnect).start()
             else:
                 logger.error("Max reconnection attempts reached")
     
+    def _do_reconnect(self):
+        """Run the scheduled reconnect attempt"""
+        self._reconnect_pending.clear()
+        self.connect()
+    
+    def _on_socket_open(self, client, userdata, sock):
+        """Send small MQTT packets immediately instead of waiting on Nagle coalescing"""
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 256 * 1024)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Failed to tune MQTT socket: {e}")
+    
     def _on_message(self, client, userdata, msg):
         """Message received callback"""
         try:
             self.messages_received += 1
             topic = msg.topic
-            payload = msg.payload.decode('utf-8')
+            payload = msg.payload
             
             logger.debug(f"Received message on topic {topic}: {payload}")
             
-            # Parse JSON payload
+            # Parse JSON payload straight from bytes
             try:
-                data = json.loads(payload)
-            except json.JSONDecodeError:
-                data = {"raw": payload}
+                data = orjson.loads(payload)
+            except orjson.JSONDecodeError:
+                data = {"raw": payload.decode('utf-8', errors='replace')}
             
-            # Call registered handlers
-            if topic in self.message_handlers:
-                for handler in self.message_handlers[topic]:
-                    try:
-                        handler(topic, data)
-                    except Exception as e:
-                        logger.error(f"Error in message handler: {e}")
+            # Call handlers of every matching filter, wildcards included
+            handlers = []
+            _match_topic(self._handler_trie, _split_topic(topic), 0, handlers)
+            for handler in handlers:
+                try:
+                    handler(topic, data)
+                except Exception as e:
+                    logger.error(f"Error in message handler: {e}")
             
         except Exception as e:
             logger.error(f"Error processing MQTT message: {e}")
@@ -181,28 +262,26 @@ class MQTTClient:
             except Exception as e:
                 logger.error(f"Failed to subscribe to {topic}: {e}")
     
-    def publish(self, topic: str, message: Dict, qos: int = 1, retain: bool = False) -> bool:
-        """Publish message to topic"""
+    def publish(self, topic: str, message: Dict, qos: int = 1, retain: bool = False,
+                full_topic: str = None) -> bool:
+        """Publish message to topic, or to a prebuilt full topic when given"""
         if not self.is_connected:
             logger.warning("MQTT client not connected")
             return False
         
-        try:
+        if full_topic is None:
             full_topic = f"{self.topic_prefix}/{topic}"
-            payload = json.dumps(message)
-            
-            result = self.client.publish(full_topic, payload, qos=qos, retain=retain)
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logger.debug(f"Published message to {full_topic}")
-                return True
-            else:
-                logger.error(f"Failed to publish message: {result.rc}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error publishing message: {e}")
+        payload = orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY)
+        
+        # Serialization and client errors propagate to the caller's handler
+        rc = self.client.publish(full_topic, payload, qos=qos, retain=retain).rc
+        if rc != _OK:
+            logger.error(f"Failed to publish message: {rc}")
             return False
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Published message to %s", full_topic)
+        return True
     
     def publish_status(self, status: str, metadata: Dict = None):
         """Publish system status"""
@@ -215,27 +294,88 @@ class MQTTClient:
         if metadata:
             message.update(metadata)
         
-        return self.publish("status", message, retain=True)
+        return self.publish("status", message, retain=True, full_topic=self._status_topic)
     
-    def publish_detection(self, camera_id: str, detection_data: Dict):
-        """Publish detection results"""
+    def publish_detection(self, camera_id: str, detection_data: Dict, timestamp: float = None):
+        """Publish detection results at QoS 0; per-frame telemetry is high-rate and a lost frame is superseded by the next"""
         message = {
             "camera_id": camera_id,
-            "timestamp": time.time(),
+            "timestamp": time.time() if timestamp is None else timestamp,
             "detection": detection_data
         }
         
-        return self.publish(f"detection/{camera_id}", message)
+        full_topic = self._detection_topics.get(camera_id)
+        if full_topic is None:
+            full_topic = self._detection_topics[camera_id] = f"{self.topic_prefix}/detection/{camera_id}"
+        
+        return self.publish(None, message, qos=0, full_topic=full_topic)
+    
+    def queue_detection(self, camera_id: str, detection_data: Dict, timestamp: float = None):
+        """Queue detection results for the next batch publish"""
+        if timestamp is None:
+            timestamp = time.time()
+        
+        with self._pending_lock:
+            self._pending.append({
+                "camera_id": camera_id,
+                "timestamp": timestamp,
+                "detection": detection_data
+            })
+            full = len(self._pending) >= self.batch_size
+        
+        if full:
+            self.flush_detections(force=True)
+    
+    def flush_detections(self, force: bool = False) -> bool:
+        """Publish queued detections once the batch is full or the interval has passed"""
+        now = time.monotonic()
+        with self._pending_lock:
+            if not self._pending:
+                return False
+            if not force and len(self._pending) < self.batch_size and now - self._last_flush < self.batch_interval:
+                return False
+            
+            batch = self._pending
+            self._pending = []
+            self._last_flush = now
+        
+        return self.publish_detection_batch(batch)
+    
+    def publish_detection_batch(self, items: List[Dict]) -> bool:
+        """Publish many detection results as a single QoS 0 message; telemetry is superseded by the next batch"""
+        if self.binary:
+            return self.publish_detection_binary(self._batch_binary_topic, {"batch": items}, qos=0)
+        return self.publish(None, {"batch": items}, qos=0, full_topic=self._batch_topic)
     
-    def publish_alert(self, alert_type: str, alert_data: Dict):
+    def publish_detection_binary(self, full_topic: str, obj: Any, qos: int = 0) -> bool:
+        """Publish msgpack-encoded detection data; consumers opt in through the /msgpack topic suffix"""
+        if not self.is_connected:
+            logger.warning("MQTT client not connected")
+            return False
+        
+        payload = msgpack.packb(obj, use_bin_type=True, default=_msgpack_default)
+        rc = self.client.publish(full_topic, payload, qos=qos).rc
+        if rc != _OK:
+            logger.error(f"Failed to publish message: {rc}")
+            return False
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Published binary message to %s", full_topic)
+        return True
+    
+    def publish_alert(self, alert_type: str, alert_data: Dict, timestamp: float = None):
         """Publish alert"""
         message = {
             "type": alert_type,
-            "timestamp": time.time(),
+            "timestamp": time.time() if timestamp is None else timestamp,
             "data": alert_data
         }
         
-        return self.publish(f"alert/{alert_type}", message)
+        full_topic = self._alert_topics.get(alert_type)
+        if full_topic is None:
+            full_topic = self._alert_topics[alert_type] = f"{self.topic_prefix}/alert/{alert_type}"
+        
+        return self.publish(None, message, full_topic=full_topic)
     
     def publish_camera_control(self, camera_id: str, action: str, params: Dict = None):
         """Publish camera control command"""
@@ -249,18 +389,27 @@ class MQTTClient:
     
     def add_message_handler(self, topic: str, handler: Callable[[str, Dict], Any]):
         """Add message handler for topic"""
-        if topic not in self.message_handlers:
-            self.message_handlers[topic] = []
-        
-        self.message_handlers[topic].append(handler)
+        handlers = self.message_handlers.get(topic, ()) + (handler,)
+        self._set_handlers(topic, handlers)
         logger.info(f"Added message handler for topic: {topic}")
     
     def remove_message_handler(self, topic: str, handler: Callable[[str, Dict], Any]):
         """Remove message handler"""
-        if topic in self.message_handlers and handler in self.message_handlers[topic]:
-            self.message_handlers[topic].remove(handler)
+        handlers = self.message_handlers.get(topic, ())
+        if handler in handlers:
+            self._set_handlers(topic, tuple(h for h in handlers if h is not handler))
             logger.info(f"Removed message handler for topic: {topic}")
     
+    def _set_handlers(self, topic: str, handlers: Tuple[Callable[[str, Dict], Any], ...]):
+        """Publish a new handler snapshot for topic to the trie and the handler map"""
+        node = self._handler_trie
+        for segment in topic.split('/'):
+            node = node.children.setdefault(segment, _TopicNode())
+        
+        # Plain attribute and key assignment, so readers always see a whole tuple
+        node.handlers = handlers
+        self.message_handlers[topic] = handlers
+    
     def get_statistics(self) -> Dict:
         """Get client statistics"""
         return {
@@ -3,18 +3,55 @@ Telegram Bot - Sends alerts and notifications
 """
 
 import logging
+import orjson
 import asyncio
+import concurrent.futures
+import queue
 import threading
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List
-import requests
+from typing import Callable, Dict, List
+import aiohttp
 
 from .config import Config
 from .database import get_db_session, Alert as AlertModel
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on cooldown entries kept for (camera, alert type) pairs
+MAX_ALERT_KEYS = 1024
+
+# Alert emojis by severity and alert type
+SEVERITY_EMOJI = {
+    "low": "ℹ️",
+    "medium": "⚠️",
+    "high": "🚨",
+    "critical": "💥"
+}
+TYPE_EMOJI = {
+    "violation": "🚨",
+    "system": "🔧",
+    "camera": "📹"
+}
+
+# Last formatted wall-clock second, shared by all message builders
+_ts_cache = (0, "")
+
+def _now_str() -> str:
+    """Current local time as 'YYYY-MM-DD HH:MM:SS', formatted at most once per second"""
+    global _ts_cache
+    second = int(time.time())
+    if second != _ts_cache[0]:
+        _ts_cache = (second, datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S'))
+    return _ts_cache[1]
+
+def _alert_header(severity: str, alert_type: str) -> str:
+    """Build the emoji header line for an alert"""
+    severity_emoji = SEVERITY_EMOJI.get(severity, "⚠️")
+    type_emoji = TYPE_EMOJI.get(alert_type, "📢")
+    return f"{severity_emoji} {type_emoji} <b>{alert_type.upper()} ALERT</b>\n\n"
+
 class TelegramBot:
     """Telegram bot for sending alerts"""
     
@@ -24,53 +61,150 @@ class TelegramBot:
         self.enabled = Config.TELEGRAM_ENABLED
         self.is_connected = False
         
+        # Bot API endpoints, resolved once
+        self._send_url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
+        self._get_me_url = f"https://api.telegram.org/bot{self.bot_token}/getMe"
+        
+        # Headers for every known severity and alert type pair
+        self._alert_headers = {
+            (severity, alert_type): _alert_header(severity, alert_type)
+            for severity in SEVERITY_EMOJI for alert_type in TYPE_EMOJI
+        }
+        
         # Alert cooldown tracking
-        self.last_alert_time = {}
+        self.last_alert_time: OrderedDict[str, float] = OrderedDict()
+        self._alert_time_lock = threading.Lock()
         self.alert_cooldown = Config.ALERT_COOLDOWN
         
         # Statistics
         self.messages_sent = 0
         self.failed_messages = 0
         
+        # Messages are posted from a background event loop over one keep-alive session
+        self._loop = None
+        self._session = None
+        self._sender_thread = None
+        self._pending_sends = set()
+        self._pending_sends_lock = threading.Lock()
+        
+        # Alerts are written to the database in batches by a background thread
+        self._alert_queue = queue.Queue()
+        self._alert_writer_thread = threading.Thread(target=self._alert_writer, daemon=True, name="AlertWriter")
+        self._alert_writer_thread.start()
+        
         if self.enabled and self.bot_token and self.chat_id:
+            self._start_sender()
             self._test_connection()
     
+    def _start_sender(self):
+        """Start the event loop thread that owns the HTTP session"""
+        self._loop = asyncio.new_event_loop()
+        self._sender_thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="TelegramSender")
+        self._sender_thread.start()
+        asyncio.run_coroutine_threadsafe(self._create_session(), self._loop).result()
+    
+    async def _create_session(self):
+        """Create the pooled HTTP session on the sender loop"""
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=75),
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+    
+    def close(self):
+        """Close the HTTP session, stop the sender loop and flush pending alerts"""
+        if self._loop is not None:
+            # Let messages already scheduled finish before the session goes away
+            with self._pending_sends_lock:
+                pending = list(self._pending_sends)
+            if pending:
+                _, not_done = concurrent.futures.wait(pending, timeout=10)
+                if not_done:
+                    logger.warning(f"{len(not_done)} Telegram messages still pending at shutdown")
+            
+            try:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.error(f"Error closing Telegram session: {e}")
+            
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._sender_thread.join(timeout=5)
+            self._loop = None
+        
+        self._alert_queue.put(None)
+        self._alert_writer_thread.join(timeout=5)
+    
+    async def _get_me(self):
+        """Fetch bot info over the shared session"""
+        async with self._session.get(self._get_me_url) as response:
+            return response.status, await response.read()
+    
     def _test_connection(self):
         """Test bot connection"""
         try:
-            url = f"https://api.telegram.org/bot{self.bot_token}/getMe"
-            response = requests.get(url, timeout=10)
+            status, body = asyncio.run_coroutine_threadsafe(self._get_me(), self._loop).result(timeout=15)
             
-            if response.status_code == 200:
-                bot_info = response.json()
+            if status == 200:
+                bot_info = orjson.loads(body)
                 if bot_info.get('ok'):
                     self.is_connected = True
                     logger.info(f"Telegram bot connected: @{bot_info['result']['username']}")
                 else:
                     logger.error("Telegram bot connection failed")
             else:
-                logger.error(f"Telegram API error: {response.status_code}")
+                logger.error(f"Telegram API error: {status}")
                 
         except Exception as e:
             logger.error(f"Failed to connect to Telegram: {e}")
     
-    def send_message(self, message: str, parse_mode: str = "HTML") -> bool:
-        """Send message to Telegram"""
-        if not self.enabled or not self.bot_token or not self.chat_id:
-            return False
+    def send_message(self, message: str, parse_mode: str = "HTML", on_sent: Callable[[], None] = None,
+                     on_failed: Callable[[], None] = None) -> bool:
+        """Queue message for Telegram without waiting for the HTTP round-trip"""
+        return self._schedule_send(message, parse_mode, on_sent, on_failed) is not None
+    
+    def _schedule_send(self, message: str, parse_mode: str, on_sent: Callable[[], None] = None,
+                       on_failed: Callable[[], None] = None):
+        """Schedule a send on the sender loop and return its future, or None when disabled"""
+        if not self.enabled or not self.bot_token or not self.chat_id or self._loop is None:
+            return None
+        
+        future = asyncio.run_coroutine_threadsafe(self._send_async(message, parse_mode, on_sent, on_failed), self._loop)
+        with self._pending_sends_lock:
+            self._pending_sends.add(future)
+        future.add_done_callback(self._send_done)
+        return future
+    
+    def _send_done(self, future):
+        """Forget a finished send"""
+        with self._pending_sends_lock:
+            self._pending_sends.discard(future)
+    
+    async def _send_async(self, message: str, parse_mode: str, on_sent: Callable[[], None] = None,
+                          on_failed: Callable[[], None] = None) -> bool:
+        """Send message to Telegram, running on_sent or on_failed with the outcome"""
+        sent = await self._post_message(message, parse_mode)
         
+        callback = on_sent if sent else on_failed
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in Telegram send callback: {e}")
+        return sent
+    
+    async def _post_message(self, message: str, parse_mode: str) -> bool:
+        """Post message to Telegram"""
         try:
-            url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
             data = {
                 'chat_id': self.chat_id,
                 'text': message,
                 'parse_mode': parse_mode
             }
             
-            response = requests.post(url, data=data, timeout=10)
+            async with self._session.post(self._send_url, data=data) as response:
+                body = await response.read()
             
-            if response.status_code == 200:
-                result = response.json()
+            if response.status == 200:
+                result = orjson.loads(body)
                 if result.get('ok'):
                     self.messages_sent += 1
                     logger.debug(f"Telegram message sent successfully")
@@ -80,7 +214,7 @@ class TelegramBot:
                     self.failed_messages += 1
                     return False
             else:
-                logger.error(f"Telegram HTTP error: {response.status_code}")
+                logger.error(f"Telegram HTTP error: {response.status}")
                 self.failed_messages += 1
                 return False
                 
@@ -96,8 +230,10 @@ class TelegramBot:
         alert_key = f"{camera_id}_{alert_type}"
         current_time = time.time()
         
-        if alert_key in self.last_alert_time:
-            time_since_last = current_time - self.last_alert_time[alert_key]
+        # Single lookup; the sender thread may lift the cooldown concurrently
+        last_sent = self.last_alert_time.get(alert_key)
+        if last_sent is not None:
+            time_since_last = current_time - last_sent
             if time_since_last < self.alert_cooldown:
                 logger.debug(f"Alert cooldown active for {alert_key}")
                 return False
@@ -107,27 +243,54 @@ class TelegramBot:
             alert_type, camera_id, message, severity, metadata
         )
         
-        # Send message
-        success = self.send_message(formatted_message)
+        # Start the cooldown now so repeats are suppressed while the send is in flight;
+        # the alert is saved once Telegram accepts it and the cooldown is lifted if it fails
+        self._record_alert_time(alert_key, current_time)
+        success = self.send_message(
+            formatted_message,
+            on_sent=lambda: self._save_alert(alert_type, camera_id, message, severity, metadata),
+            on_failed=lambda: self._clear_alert_time(alert_key, current_time)
+        )
         
-        if success:
-            self.last_alert_time[alert_key] = current_time
-            
-            # Save to database
-            self._save_alert(alert_type, camera_id, message, severity, metadata)
+        if not success:
+            self._clear_alert_time(alert_key, current_time)
         
         return success
     
+    def _record_alert_time(self, alert_key: str, current_time: float):
+        """Record alert time, keeping entries ordered oldest first and bounded"""
+        with self._alert_time_lock:
+            last_alert_time = self.last_alert_time
+            last_alert_time[alert_key] = current_time
+            last_alert_time.move_to_end(alert_key)
+            
+            # Entries past twice the cooldown no longer suppress anything
+            expiry = current_time - 2 * self.alert_cooldown
+            while last_alert_time and next(iter(last_alert_time.values())) < expiry:
+                last_alert_time.popitem(last=False)
+            
+            while len(last_alert_time) > MAX_ALERT_KEYS:
+                last_alert_time.popitem(last=False)
+    
+    def _clear_alert_time(self, alert_key: str, current_time: float):
+        """Lift the cooldown started at current_time, unless a later alert replaced it"""
+        with self._alert_time_lock:
+            if self.last_alert_time.get(alert_key) == current_time:
+                del self.last_alert_time[alert_key]
+    
     def send_violation_alert(self, camera_id: str, camera_name: str, 
                            violations: int, location: str = None) -> bool:
         """Send mask violation alert"""
-        message = f"🚨 <b>Mask Violation Detected</b>\n\n"
-        message += f"📹 Camera: {camera_name}\n"
+        parts = ["🚨 <b>Mask Violation Detected</b>", "", f"📹 Camera: {camera_name}"]
         if location:
-            message += f"📍 Location: {location}\n"
-        message += f"👥 Violations: {violations}\n"
-        message += f"⏰ Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        message += "Please ensure proper mask usage in this area."
+            parts.append(f"📍 Location: {location}")
+        parts.extend((
+            f"👥 Violations: {violations}",
+            f"⏰ Time: {_now_str()}",
+            "",
+            "Please ensure proper mask usage in this area."
+        ))
+        message = "\n".join(parts)
         
         return self.send_alert(
             alert_type="violation",
@@ -138,11 +301,14 @@ class TelegramBot:
     
     def send_system_alert(self, component: str, message: str, severity: str = "medium") -> bool:
         """Send system alert"""
-        formatted_message = f"🔧 <b>System Alert</b>\n\n"
-        formatted_message += f"Component: {component}\n"
-        formatted_message += f"Message: {message}\n"
-        formatted_message += f"Severity: {severity.upper()}\n"
-        formatted_message += f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        formatted_message = "\n".join((
+            "🔧 <b>System Alert</b>",
+            "",
+            f"Component: {component}",
+            f"Message: {message}",
+            f"Severity: {severity.upper()}",
+            f"Time: {_now_str()}"
+        ))
         
         return self.send_alert(
             alert_type="system",
@@ -154,11 +320,14 @@ class TelegramBot:
     def send_camera_alert(self, camera_id: str, camera_name: str, 
                          alert_type: str, message: str) -> bool:
         """Send camera-specific alert"""
-        formatted_message = f"📹 <b>Camera Alert</b>\n\n"
-        formatted_message += f"Camera: {camera_name}\n"
-        formatted_message += f"Type: {alert_type}\n"
-        formatted_message += f"Message: {message}\n"
-        formatted_message += f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        formatted_message = "\n".join((
+            "📹 <b>Camera Alert</b>",
+            "",
+            f"Camera: {camera_name}",
+            f"Type: {alert_type}",
+            f"Message: {message}",
+            f"Time: {_now_str()}"
+        ))
         
         return self.send_alert(
             alert_type="camera",
@@ -169,78 +338,96 @@ class TelegramBot:
     
     def send_daily_report(self, report_data: Dict) -> bool:
         """Send daily summary report"""
-        message = f"📊 <b>Daily Report</b>\n\n"
-        message += f"📅 Date: {datetime.now().strftime('%Y-%m-%d')}\n\n"
-        
         # Summary statistics
         total_detections = report_data.get('total_detections', 0)
         total_violations = report_data.get('total_violations', 0)
         active_cameras = report_data.get('active_cameras', 0)
         
-        message += f"📈 Total Detections: {total_detections}\n"
-        message += f"🚨 Total Violations: {total_violations}\n"
-        message += f"📹 Active Cameras: {active_cameras}\n"
+        parts = [
+            "📊 <b>Daily Report</b>",
+            "",
+            f"📅 Date: {_now_str()[:10]}",
+            "",
+            f"📈 Total Detections: {total_detections}",
+            f"🚨 Total Violations: {total_violations}",
+            f"📹 Active Cameras: {active_cameras}"
+        ]
         
         if total_detections > 0:
             violation_rate = (total_violations / total_detections) * 100
-            message += f"📊 Violation Rate: {violation_rate:.1f}%\n"
+            parts.append(f"📊 Violation Rate: {violation_rate:.1f}%")
         
         # Camera breakdown
         if 'camera_stats' in report_data:
-            message += "\n📹 <b>Camera Breakdown:</b>\n"
+            parts.append("")
+            parts.append("📹 <b>Camera Breakdown:</b>")
             for camera in report_data['camera_stats']:
-                message += f"• {camera['name']}: {camera['detections']} detections, {camera['violations']} violations\n"
+                parts.append(f"• {camera['name']}: {camera['detections']} detections, {camera['violations']} violations")
         
-        return self.send_message(message)
+        # Every line, including the last, ends with a newline
+        parts.append("")
+        return self.send_message("\n".join(parts))
     
     def _format_alert_message(self, alert_type: str, camera_id: str, message: str,
                              severity: str, metadata: Dict = None) -> str:
         """Format alert message with emojis and styling"""
-        # Add severity emoji
-        severity_emoji = {
-            "low": "ℹ️",
-            "medium": "⚠️", 
-            "high": "🚨",
-            "critical": "💥"
-        }.get(severity, "⚠️")
-        
-        # Add alert type emoji
-        type_emoji = {
-            "violation": "🚨",
-            "system": "🔧",
-            "camera": "📹"
-        }.get(alert_type, "📢")
+        # Look up the precomputed emoji header; unknown combinations are built once and cached
+        key = (severity, alert_type)
+        header = self._alert_headers.get(key)
+        if header is None:
+            header = self._alert_headers[key] = _alert_header(severity, alert_type)
         
-        formatted = f"{severity_emoji} {type_emoji} <b>{alert_type.upper()} ALERT</b>\n\n"
-        formatted += message
+        parts = [header, message]
         
         if metadata:
-            formatted += "\n\n📋 <b>Additional Info:</b>\n"
-            for key, value in metadata.items():
-                formatted += f"• {key}: {value}\n"
+            parts.append("\n\n📋 <b>Additional Info:</b>\n")
+            parts.extend(f"• {key}: {value}\n" for key, value in metadata.items())
         
-        return formatted
+        return "".join(parts)
     
     def _save_alert(self, alert_type: str, camera_id: str, message: str, 
                    severity: str, metadata: Dict = None):
-        """Save alert to database"""
-        try:
-            session = get_db_session()
-            
-            alert = AlertModel(
-                camera_id=camera_id,
-                alert_type=alert_type,
-                severity=severity,
-                message=message,
-                timestamp=datetime.now()
-            )
+        """Queue alert for the database writer"""
+        self._alert_queue.put(AlertModel(
+            camera_id=camera_id,
+            alert_type=alert_type,
+            severity=severity,
+            message=message,
+            timestamp=datetime.now()
+        ))
+    
+    def _alert_writer(self):
+        """Commit queued alerts in batches of up to 100 rows or 200 ms"""
+        running = True
+        while running:
+            alert = self._alert_queue.get()
+            if alert is None:
+                break
             
-            session.add(alert)
-            session.commit()
-            session.close()
+            batch = [alert]
+            deadline = time.monotonic() + 0.2
+            while len(batch) < 100:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    alert = self._alert_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if alert is None:
+                    running = False
+                    break
+                batch.append(alert)
             
-        except Exception as e:
-            logger.error(f"Failed to save alert to database: {e}")
+            session = get_db_session()
+            try:
+                session.add_all(batch)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Failed to save {len(batch)} alerts to database: {e}")
+            finally:
+                session.close()
     
     def get_statistics(self) -> Dict:
         """Get bot statistics"""
@@ -255,8 +442,20 @@ class TelegramBot:
     
     def test_connection(self) -> bool:
         """Test bot connection"""
-        test_message = "🤖 Face Mask Detection System - Connection Test\n\n"
-        test_message += f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        test_message += "Status: System is running and connected!"
+        test_message = "\n".join((
+            "🤖 Face Mask Detection System - Connection Test",
+            "",
+            f"Time: {_now_str()}",
+            "Status: System is running and connected!"
+        ))
         
-        return self.send_message(test_message)
+        # Wait for the round-trip so the result reflects delivery, not just scheduling
+        future = self._schedule_send(test_message, "HTML")
+        if future is None:
+            return False
+        
+        try:
+            return future.result(timeout=15)
+        except Exception as e:
+            logger.error(f"Telegram connection test failed: {e}")
+            return False
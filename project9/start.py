@@ -9,18 +9,12 @@ import sys
 import time
 import logging
 import threading
-from datetime import datetime
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.config import Config
 from src.database import init_db
-from src.camera_manager import CameraManager
-from src.detection_engine import DetectionEngine
-from src.telegram_bot import TelegramBot
-from src.mqtt_client import MQTTClient
-from src.analytics import AnalyticsEngine
 
 # Configure logging
 logging.basicConfig(
@@ -58,6 +52,14 @@ class FaceMaskDetectionSystem:
             init_db()
             logger.info("Database initialized successfully")
             
+            # Component modules pull in OpenCV, TensorFlow and the network clients,
+            # so they are imported only once the system is actually built
+            from src.camera_manager import CameraManager
+            from src.detection_engine import DetectionEngine
+            from src.telegram_bot import TelegramBot
+            from src.mqtt_client import MQTTClient
+            from src.analytics import AnalyticsEngine
+            
             # Initialize components
             self.camera_manager = CameraManager()
             self.detection_engine = DetectionEngine()
@@ -81,7 +83,8 @@ class FaceMaskDetectionSystem:
             self.detection_engine.start()
             logger.info("Detection engine started")
             
-            # Start camera manager
+            # Start camera manager; stream threads feed frames straight to the detection engine
+            self.camera_manager.set_frame_handler(self.detection_engine.add_frame)
             self.camera_manager.start()
             logger.info("Camera manager started")
             
@@ -109,22 +112,16 @@ class FaceMaskDetectionSystem:
         
         while self.is_running:
             try:
-                # Get frames from cameras
-                frames = self.camera_manager.get_active_frames()
-                
-                # Add frames to detection engine
-                for frame_data in frames:
-                    self.detection_engine.add_frame(frame_data)
-                
-                # Get detection results
-                results = self.detection_engine.get_results()
+                # Block until detection results arrive
+                results = self.detection_engine.get_results(timeout=0.5)
                 
                 # Process results
                 for result in results:
                     self._process_detection_result(result)
                 
-                # Sleep to prevent CPU overload
-                time.sleep(0.1)
+                # Publish queued detections once the batch is full or due
+                if self.mqtt_client.is_connected:
+                    self.mqtt_client.flush_detections()
                 
             except KeyboardInterrupt:
                 logger.info("Received interrupt signal, shutting down...")
@@ -138,6 +135,8 @@ class FaceMaskDetectionSystem:
         try:
             camera_id = result.get('camera_id')
             no_mask_count = result.get('no_masks_detected', 0)
+            # One clock read shared by every message for this event
+            ts = time.time()
             
             # Check for violations
             if no_mask_count > 0:
@@ -158,12 +157,12 @@ class FaceMaskDetectionSystem:
                         self.mqtt_client.publish_alert('violation', {
                             'camera_id': camera_id,
                             'violations': no_mask_count,
-                            'timestamp': datetime.now().isoformat()
-                        })
+                            'timestamp': ts
+                        }, timestamp=ts)
             
-            # Publish detection to MQTT
+            # Queue detection for the next MQTT batch
             if self.mqtt_client.is_connected:
-                self.mqtt_client.publish_detection(camera_id, result)
+                self.mqtt_client.queue_detection(camera_id, result, timestamp=ts)
                 
         except Exception as e:
             logger.error(f"Error processing detection result: {e}")
@@ -182,7 +181,15 @@ class FaceMaskDetectionSystem:
             self.detection_engine.stop()
             logger.info("Detection engine stopped")
         
+        if self.telegram_bot:
+            self.telegram_bot.close()
+        
         if self.mqtt_client:
+            if self.mqtt_client.is_connected:
+                try:
+                    self.mqtt_client.flush_detections(force=True)
+                except Exception as e:
+                    logger.error(f"Error publishing queued detections: {e}")
             self.mqtt_client.disconnect()
             logger.info("MQTT client disconnected")
         
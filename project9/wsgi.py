@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Face Mask Detection System - WSGI entry point
+
+Run with a single threaded Gunicorn worker (Socket.IO needs one process
+without sticky sessions):
+
+    gunicorn -w 1 --threads 100 -b 0.0.0.0:5000 wsgi:app
+"""
+
+import os
+
+os.makedirs('logs', exist_ok=True)
+
+from app import app, initialize_services
+
+initialize_services()